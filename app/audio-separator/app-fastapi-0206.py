@@ -46,6 +46,8 @@ class AppConfig:
 class AudioSeparatorProcessor:
     def __init__(self, config: AppConfig):
         self.config = config
+        # 长连接 HTTP 会话, 在事件循环内首次下载时创建, 所有请求复用
+        self._session = None
         self._initialize_directories()
         self._initialize_separator()
 
@@ -69,48 +71,62 @@ class AudioSeparatorProcessor:
             logger.error(f"Failed to initialize separator: {str(e)}")
             raise
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的 HTTP 会话, 复用连接与 DNS 解析结果"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=60)
+            )
+        return self._session
+
+    async def close(self):
+        """关闭共享的 HTTP 会话"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def download_file(self, url: str, request_id: str) -> str:
         """从URL下载文件到临时目录"""
         logger.info(f"[{request_id}] Starting file download from URL: {url}")
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Failed to download file: HTTP {response.status}"
-                        )
-
-                    content_length = response.headers.get("content-length")
-                    if content_length and int(content_length) > self.config.MAX_FILE_SIZE:
-                        raise HTTPException(
-                            status_code=413,
-                            detail="File size exceeds maximum allowed size"
-                        )
+            async with self._get_session().get(url) as response:
+                if response.status != 200:
+                    raise HTTPException(
+                        status_code=response.status,
+                        detail=f"Failed to download file: HTTP {response.status}"
+                    )
 
-                    filename = self._generate_temp_filename(
-                        response.headers.get("content-disposition"),
-                        url
+                content_length = response.headers.get("content-length")
+                if content_length and int(content_length) > self.config.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail="File size exceeds maximum allowed size"
                     )
-                    file_path = os.path.join(self.config.TEMP_DIR, filename)
-
-                    with open(file_path, 'wb') as f:
-                        total_size = 0
-                        while True:
-                            chunk = await response.content.read(8192)
-                            if not chunk:
-                                break
-                            total_size += len(chunk)
-                            if total_size > self.config.MAX_FILE_SIZE:
-                                os.remove(file_path)
-                                raise HTTPException(
-                                    status_code=413,
-                                    detail="File size exceeds maximum allowed size"
-                                )
-                            f.write(chunk)
-
-                    logger.info(f"[{request_id}] File downloaded successfully: {file_path}")
-                    return file_path
+
+                filename = self._generate_temp_filename(
+                    response.headers.get("content-disposition"),
+                    url
+                )
+                file_path = os.path.join(self.config.TEMP_DIR, filename)
+
+                with open(file_path, 'wb') as f:
+                    total_size = 0
+                    while True:
+                        chunk = await response.content.read(8192)
+                        if not chunk:
+                            break
+                        total_size += len(chunk)
+                        if total_size > self.config.MAX_FILE_SIZE:
+                            os.remove(file_path)
+                            raise HTTPException(
+                                status_code=413,
+                                detail="File size exceeds maximum allowed size"
+                            )
+                        f.write(chunk)
+
+                logger.info(f"[{request_id}] File downloaded successfully: {file_path}")
+                return file_path
 
         except aiohttp.ClientError as e:
             logger.error(f"[{request_id}] Download failed: {str(e)}")
@@ -195,9 +211,15 @@ class AudioSeparatorProcessor:
                 logger.warning(f"[{request_id}] Failed to clean up file {file_path}: {str(e)}")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await processor.close()
+
+
 # 创建应用实例
 config = AppConfig()
-app = FastAPI(title="Audio Separator API", version="1.0.0")
+app = FastAPI(title="Audio Separator API", version="1.0.0", lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+
+from config import settings
+from executor import separation_executor, QueueFullError
+
+
+class MicroBatcher:
+    """有空闲工作进程时立即派发分离请求; 所有进程都忙时按模型暂存, 进程空闲后成批派发给它
+
+    Separator 无法把多个输入合并推理, 同一批请求在工作进程中只能依次执行, 因此只合并本就需要排队的请求:
+    每次进程空闲时取走该模型等待请求的 1/max_workers(不超过批大小), 其余留给随后空闲的进程,
+    避免整批压在一个进程上。同一批请求在工作进程中只查一次模型缓存, 结果再按请求拆分返回。
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = settings.BATCH_MAX_SIZE if max_size is None else max_size
+        # model -> [(seq, input_path, request_id, future), ...]
+        self._pending = {}
+        self._seq = itertools.count()
+        self._tasks = set()
+        # 已创建但尚未提交到进程池的批次数, 计入忙碌的工作进程
+        self._starting = 0
+        # 任何进程池任务(包括预热、长输入窗口)结束时都派发等待中的请求
+        separation_executor.add_idle_listener(self._flush_waiting)
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(batch) for batch in self._pending.values())
+
+    def has_idle_worker(self) -> bool:
+        return separation_executor.idle_workers > self._starting
+
+    async def submit(self, input_path: str, model: str, request_id: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self.has_idle_worker():
+            self._dispatch(model, [(input_path, request_id, future)])
+            return await future
+        # 暂存的请求同样占用分离队列容量
+        if separation_executor.pending + self.waiting >= separation_executor.capacity:
+            raise QueueFullError(separation_executor.pending + self.waiting)
+        self._pending.setdefault(model, []).append((next(self._seq), input_path, request_id, future))
+        return await future
+
+    def _dispatch(self, model: str, batch):
+        self._starting += 1
+        task = asyncio.create_task(self._run(model, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _flush_waiting(self):
+        """按到达顺序为空闲的工作进程派发等待中的请求"""
+        while self._pending and self.has_idle_worker():
+            # 最早到达的请求所属的模型先派发
+            model = min(self._pending, key=lambda m: self._pending[m][0][0])
+            batch = self._pending[model]
+            size = min(self.max_size, -(-len(batch) // separation_executor.max_workers))
+            taken, self._pending[model] = batch[:size], batch[size:]
+            if not self._pending[model]:
+                del self._pending[model]
+            self._dispatch(model, [(input_path, request_id, future) for _, input_path, request_id, future in taken])
+
+    async def _run(self, model: str, batch):
+        items = [(input_path, request_id) for input_path, request_id, _ in batch]
+        # separate_batch 在首次 await 前即计入 separation_executor.running
+        self._starting -= 1
+        try:
+            results = await separation_executor.separate_batch(model, items)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+micro_batcher = MicroBatcher()
@@ -0,0 +1,383 @@
+"""as-src 压测脚本
+
+生成指定时长与格式的合成音频, 以目标并发调用 POST /separate-audio/, 按场景输出:
+- 客户端延迟 p50/p95/p99 与吞吐
+- 服务端各阶段耗时(取自 /metrics 的 audio_separator_stage_seconds)
+- 按进程角色(api / separation_worker / ffmpeg)统计的 RSS 峰值
+
+默认在本地以压测桩模式(SEPARATOR_STUB=true)启动服务, 只衡量 HTTP、输入与调度开销;
+指定 --url 时压测已在运行的服务(此时不采集 RSS)。
+
+    python benchmark.py --durations 10,60 --formats wav,mp3 --concurrency 8 --requests 32
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import asyncio
+import tempfile
+import threading
+import subprocess
+
+import aiohttp
+import numpy as np
+import soundfile as sf
+
+SAMPLE_RATE = 44100
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PERCENTILES = (50, 95, 99)
+
+# 输入格式 -> ffmpeg 编码参数, None 表示直接用 soundfile 写出
+INPUT_FORMATS = {
+    "wav": None,
+    "flac": None,
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "192k", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-b:a", "128k", "-f", "ogg"],
+}
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL_PAIR = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def synth_audio(duration: float, seed: int) -> np.ndarray:
+    """合成带颤音的谐波"人声"加宽带伴奏噪声, 每个 seed 内容不同以避开结果缓存"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    f0 = rng.uniform(150, 300) * (1 + 0.02 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6)) * 0.2
+    noise = rng.standard_normal((len(t), 2)) * 0.05
+    return (voice[:, None] + noise).astype(np.float32)
+
+
+def write_audio(path: str, audio: np.ndarray, fmt: str):
+    codec_args = INPUT_FORMATS[fmt]
+    if codec_args is None:
+        sf.write(path, audio, SAMPLE_RATE, format=fmt.upper())
+        return
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", "2", "-i", "pipe:0"]
+        + codec_args + [path],
+        input=audio.tobytes(), check=True
+    )
+
+
+def generate_inputs(work_dir: str, duration: float, fmt: str, variants: int):
+    """生成 variants 个内容互不相同的输入文件"""
+    extension = "ogg" if fmt == "opus" else fmt
+    paths = []
+    for seed in range(variants):
+        path = os.path.join(work_dir, f"input_{int(duration)}s_{seed}.{extension}")
+        if not os.path.exists(path):
+            write_audio(path, synth_audio(duration, seed), fmt)
+        paths.append(path)
+    return paths
+
+
+def percentiles(values):
+    if not values:
+        return {f"p{q}": None for q in PERCENTILES}
+    return {f"p{q}": float(np.percentile(values, q)) for q in PERCENTILES}
+
+
+class RssSampler(threading.Thread):
+    """周期性读取 /proc, 记录服务进程树中各角色进程 RSS 之和的峰值"""
+
+    def __init__(self, root_pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _read(pid: str, name: str) -> str:
+        with open(f"/proc/{pid}/{name}", "rb") as f:
+            return f.read().decode(errors="ignore")
+
+    def _process_tree(self):
+        """返回 [(pid, 角色, rss 字节)], 角色按命令行区分"""
+        parents = {}
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                stat = self._read(pid, "stat")
+                parents[pid] = stat[stat.rindex(")") + 2:].split()[1]
+            except (OSError, ValueError):
+                continue
+        tree = {str(self.root_pid)}
+        changed = True
+        while changed:
+            children = {pid for pid, ppid in parents.items() if ppid in tree} - tree
+            tree |= children
+            changed = bool(children)
+        processes = []
+        for pid in tree:
+            try:
+                cmdline = self._read(pid, "cmdline").split("\0")
+                rss = int(re.search(r"VmRSS:\s+(\d+)", self._read(pid, "status")).group(1)) * 1024
+            except (OSError, AttributeError):
+                continue
+            if pid == str(self.root_pid):
+                role = "api"
+            elif "multiprocessing" in " ".join(cmdline):
+                role = "separation_worker"
+            else:
+                role = os.path.basename(cmdline[0]) or "other"
+            processes.append((pid, role, rss))
+        return processes
+
+    def run(self):
+        while not self._stop_event.is_set():
+            totals = {}
+            for _, role, rss in self._process_tree():
+                totals[role] = totals.get(role, 0) + rss
+            for role, rss in totals.items():
+                self.peaks[role] = max(self.peaks.get(role, 0), rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def parse_metrics(text: str) -> dict:
+    """解析 Prometheus 文本格式为 {(指标名, ((标签, 值), ...)): 数值}"""
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match or line.startswith("#"):
+            continue
+        name, labels, value = match.groups()
+        labels = tuple(sorted(LABEL_PAIR.findall(labels or "")))
+        samples[(name, labels)] = float(value)
+    return samples
+
+
+def histogram_quantile(q: float, buckets):
+    """按 Prometheus histogram_quantile 的方式在分桶内线性插值"""
+    total = buckets[-1][1]
+    if total <= 0:
+        return None
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def stage_summary(before: dict, after: dict) -> dict:
+    """两次 /metrics 之间各阶段的次数、平均与分位耗时"""
+    stages = {}
+    for key, value in after.items():
+        name, labels = key
+        if name != "audio_separator_stage_seconds_bucket":
+            continue
+        labels = dict(labels)
+        # 同一阶段的不同模型合并统计
+        buckets = stages.setdefault(labels["stage"], {})
+        bound = float(labels["le"])
+        buckets[bound] = buckets.get(bound, 0) + value - before.get(key, 0)
+    summary = {}
+    for stage, buckets in stages.items():
+        buckets = sorted(buckets.items())
+        count = buckets[-1][1]
+        if count <= 0:
+            continue
+        total_sum = sum(after.get(key, 0) - before.get(key, 0) for key in after
+                        if key[0] == "audio_separator_stage_seconds_sum" and dict(key[1])["stage"] == stage)
+        summary[stage] = {"count": int(count), "mean": total_sum / count}
+        summary[stage].update({f"p{q}": histogram_quantile(q / 100, buckets) for q in PERCENTILES})
+    return summary
+
+
+async def fetch_metrics(session: aiohttp.ClientSession, base_url: str) -> dict:
+    async with session.get(f"{base_url}/metrics") as response:
+        return parse_metrics(await response.text())
+
+
+async def run_scenario(base_url: str, model: str, files, concurrency: int, requests: int,
+                       output_format: str = None) -> dict:
+    """以固定并发发出 requests 个请求, 返回延迟、吞吐与失败数"""
+    latencies = []
+    errors = []
+    next_index = 0
+
+    async def send(session, path):
+        data = aiohttp.FormData()
+        data.add_field("model", model)
+        if output_format:
+            data.add_field("output_format", output_format)
+        with open(path, "rb") as f:
+            data.add_field("file", f.read(), filename=os.path.basename(path))
+        start = time.perf_counter()
+        async with session.post(f"{base_url}/separate-audio/", data=data) as response:
+            body = await response.json()
+        elapsed = time.perf_counter() - start
+        if response.status == 200 and body.get("output_files"):
+            latencies.append(elapsed)
+        else:
+            errors.append(body.get("message") or str(response.status))
+
+    async def client(session):
+        nonlocal next_index
+        while next_index < requests:
+            path = files[next_index % len(files)]
+            next_index += 1
+            try:
+                await send(session, path)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                errors.append(str(e))
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        before = await fetch_metrics(session, base_url)
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        wall = time.perf_counter() - start
+        after = await fetch_metrics(session, base_url)
+
+    hits = sum(value - before.get(key, 0) for key, value in after.items()
+               if key[0] == "audio_separator_result_cache_hits_total")
+    return {
+        "requests": requests,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "errors": sorted(set(errors))[:5],
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "latency": {"mean": float(np.mean(latencies)) if latencies else None, **percentiles(latencies)},
+        "stages": stage_summary(before, after),
+        "result_cache_hits": int(hits),
+    }
+
+
+def start_server(args, work_dir: str) -> subprocess.Popen:
+    """在压测目录下启动服务, 输出与临时文件均写入 work_dir"""
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(args.port),
+        "SEPARATOR_STUB": "false" if args.real else "true",
+        "SEPARATOR_STUB_SECONDS": str(args.stub_seconds),
+        "OUTPUT_DIR": os.path.join(work_dir, "output"),
+        "TEMP_DIR": os.path.join(work_dir, "temp"),
+        "LOG_DIR": os.path.join(work_dir, "log"),
+        "RESULT_CACHE_DB": os.path.join(work_dir, "output", ".result_cache.sqlite3"),
+        "PRELOAD_MODELS": args.model,
+    })
+    if args.workers:
+        env["SEPARATION_WORKERS"] = str(args.workers)
+    log = open(os.path.join(work_dir, "server.log"), "wb")
+    return subprocess.Popen([sys.executable, "main.py"], cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float):
+    deadline = time.time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.time() < deadline:
+            if server is not None and server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}, see server.log")
+            try:
+                async with session.get(f"{base_url}/ready") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def format_seconds(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_report(name: str, result: dict):
+    latency = result["latency"]
+    print(f"\n== {name}: {result['succeeded']}/{result['requests']} ok, "
+          f"{result['throughput_rps']:.2f} req/s, wall {result['wall_seconds']:.1f}s, "
+          f"result cache hits {result['result_cache_hits']}")
+    print(f"   latency  mean {format_seconds(latency['mean'])}  " +
+          "  ".join(f"p{q} {format_seconds(latency[f'p{q}'])}" for q in PERCENTILES))
+    for stage, stats in sorted(result["stages"].items()):
+        print(f"   {stage:<12} n={stats['count']:<5} mean {format_seconds(stats['mean'])}  " +
+              "  ".join(f"p{q} {format_seconds(stats[f'p{q}'])}" for q in PERCENTILES))
+    for role, rss in sorted(result.get("peak_rss_bytes", {}).items()):
+        print(f"   peak rss {role:<18} {rss / 1024 / 1024:.1f} MiB")
+    for error in result["errors"]:
+        print(f"   error: {error}")
+
+
+async def main(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="as-benchmark-")
+    for name in ("inputs", "output", "temp", "log"):
+        os.makedirs(os.path.join(work_dir, name), exist_ok=True)
+    server = None
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        server = start_server(args, work_dir)
+    results = {}
+    try:
+        await wait_ready(base_url, server, args.ready_timeout)
+        for duration in args.durations:
+            for fmt in args.formats:
+                name = f"{duration:g}s-{fmt}"
+                print(f"generating {args.variants or args.requests} x {name} inputs ...", flush=True)
+                files = generate_inputs(os.path.join(work_dir, "inputs"), duration, fmt,
+                                        args.variants or args.requests)
+                sampler = RssSampler(server.pid) if server is not None else None
+                if sampler:
+                    sampler.start()
+                try:
+                    result = await run_scenario(base_url, args.model, files, args.concurrency, args.requests,
+                                                args.output_format)
+                finally:
+                    if sampler:
+                        sampler.stop()
+                result["peak_rss_bytes"] = sampler.peaks if sampler else {}
+                results[name] = result
+                print_report(name, result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "scenarios": results}, f, indent=2)
+    print(f"\nwork dir: {work_dir}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the as-src separation API")
+    parser.add_argument("--url", help="压测已运行的服务, 不指定则在本地启动")
+    parser.add_argument("--port", type=int, default=6100, help="本地启动服务的端口")
+    parser.add_argument("--model", default="UVR-MDX-NET-Inst_HQ_3.onnx")
+    parser.add_argument("--durations", default="10,60", help="输入时长(秒), 逗号分隔")
+    parser.add_argument("--formats", default="wav,mp3", help=f"输入格式, 可选 {','.join(INPUT_FORMATS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32, help="每个场景的请求数")
+    parser.add_argument("--variants", type=int, default=0, help="每个场景的不同输入数, 默认与请求数相同(不命中结果缓存)")
+    parser.add_argument("--output-format", default=None, help="请求的输出格式, 如 flac/mp3")
+    parser.add_argument("--workers", type=int, default=0, help="覆盖 SEPARATION_WORKERS")
+    parser.add_argument("--real", action="store_true", help="使用真实模型而非 StubSeparator")
+    parser.add_argument("--stub-seconds", type=float, default=0.0, help="桩模式下每秒音频模拟的推理耗时")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--work-dir", help="输入、输出与日志目录, 默认新建临时目录")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+    args.durations = [float(d) for d in args.durations.split(",") if d]
+    args.formats = [f for f in args.formats.split(",") if f]
+    unknown = set(args.formats) - set(INPUT_FORMATS)
+    if unknown:
+        parser.error(f"unsupported formats: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
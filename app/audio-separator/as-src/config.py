@@ -12,5 +12,76 @@ class Settings:
     ALLOWED_EXTENSIONS = {'.mp3', '.wav', '.flac', '.m4a', '.ogg'}
     STATIC_SERVE_URL = os.getenv("STATIC_SERVE_URL", "http://101.200.146.208:6002")
     PORT = int(os.getenv("PORT", 6000))  # 确保端口是整数
+    # 模型缓存: 内存预算(字节)与最多常驻模型数, 超出时按 LRU 淘汰
+    MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))  # 2GB
+    MODEL_CACHE_MAX_MODELS = int(os.getenv("MODEL_CACHE_MAX_MODELS", 4))
+    # 分离进程池: 工作进程数与排队上限, 每个进程各自持有 Separator
+    SEPARATION_WORKERS = int(os.getenv("SEPARATION_WORKERS", 2))
+    SEPARATION_QUEUE_SIZE = int(os.getenv("SEPARATION_QUEUE_SIZE", 8))
+    # 启动预热: 逗号分隔的模型文件名, 每个分离进程启动时加载并用一段 WARMUP_SECONDS 秒的音频试跑
+    PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "").split(",") if m.strip()]
+    WARMUP_SECONDS = float(os.getenv("WARMUP_SECONDS", 2))
+    # 等待所有分离进程完成预热的上限秒数, 超时后不再等待直接就绪
+    WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 600))
+    # 压测桩: 开启后用 StubSeparator 代替模型推理, 按每秒音频 SEPARATOR_STUB_SECONDS 秒模拟耗时
+    SEPARATOR_STUB = os.getenv("SEPARATOR_STUB", "false").lower() in ("1", "true", "yes")
+    SEPARATOR_STUB_SECONDS = float(os.getenv("SEPARATOR_STUB_SECONDS", 0))
+    # 微批调度: 所有分离进程都忙时, 同一模型的等待请求在进程空闲后合批派发的最大批大小; 以及 MDX 推理的分段批大小
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 4))
+    SEPARATION_BATCH_SIZE = int(os.getenv("SEPARATION_BATCH_SIZE", 4))
+    # 批量接口: 单次最多条目数, 同时下载数与同时分离数(分离数不宜超过进程池容量)
+    BATCH_REQUEST_MAX_ITEMS = int(os.getenv("BATCH_REQUEST_MAX_ITEMS", 50))
+    BATCH_REQUEST_DOWNLOADS = int(os.getenv("BATCH_REQUEST_DOWNLOADS", 8))
+    BATCH_REQUEST_SEPARATIONS = int(os.getenv("BATCH_REQUEST_SEPARATIONS", SEPARATION_WORKERS * BATCH_MAX_SIZE))
+    # 输出编码: 默认输出格式(wav/flac/opus/mp3)、有损格式码率与后台编码线程数
+    OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "wav")
+    OUTPUT_BITRATE = os.getenv("OUTPUT_BITRATE", "128k")
+    ENCODER_WORKERS = int(os.getenv("ENCODER_WORKERS", 2))
+    # 长输入分窗分离: 超过阈值(秒, 0 为关闭)的输入按窗长切分, 相邻窗口重叠并交叉淡化, 窗口并行度可配
+    LONG_INPUT_THRESHOLD_SECONDS = float(os.getenv("LONG_INPUT_THRESHOLD_SECONDS", 600))
+    LONG_INPUT_WINDOW_SECONDS = float(os.getenv("LONG_INPUT_WINDOW_SECONDS", 60))
+    LONG_INPUT_OVERLAP_SECONDS = float(os.getenv("LONG_INPUT_OVERLAP_SECONDS", 2))
+    LONG_INPUT_PARALLELISM = int(os.getenv("LONG_INPUT_PARALLELISM", 2))
+    # 内存解码: 不超过该大小的输入不写临时文件, 经 ffmpeg 管道解码后以 INMEMORY_DIR(tmpfs)中的 WAV 交给分离进程;
+    # 解码后(44.1kHz 双声道 float32)超过 INMEMORY_DECODED_MAX_BYTES 的输入仍走临时文件, 限制单个请求占用的内存盘
+    INMEMORY_DECODE_MAX_BYTES = int(os.getenv("INMEMORY_DECODE_MAX_BYTES", 16 * 1024 * 1024))  # 16MB
+    INMEMORY_DECODED_MAX_BYTES = int(os.getenv("INMEMORY_DECODED_MAX_BYTES", 128 * 1024 * 1024))  # 128MB, 约 6 分钟
+    INMEMORY_DIR = os.getenv("INMEMORY_DIR", "/dev/shm/audio-separator-temp")
+    # 日志: 目录、文件日志级别、轮转方式(daily 按天 / size 按大小)及其参数, 以及完整响应体的抽样比例
+    LOG_DIR = os.getenv("LOG_DIR", "log")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_ROTATION = os.getenv("LOG_ROTATION", "daily")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))  # 50MB
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 10))
+    LOG_RESPONSE_SAMPLE_RATE = float(os.getenv("LOG_RESPONSE_SAMPLE_RATE", 0.1))
+    # 存储清理: 输出文件保留时间(秒)与磁盘预算, 临时文件保留时间, 清理周期(秒, 0 为只在启动时清理临时文件)
+    OUTPUT_TTL_SECONDS = int(os.getenv("OUTPUT_TTL_SECONDS", 7 * 24 * 3600))
+    OUTPUT_MAX_BYTES = int(os.getenv("OUTPUT_MAX_BYTES", 20 * 1024 * 1024 * 1024))  # 20GB
+    TEMP_TTL_SECONDS = int(os.getenv("TEMP_TTL_SECONDS", 3 * 3600))
+    SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", 600))
+    # 异步任务: 排队上限与已完成任务结果保留时间(秒)
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 32))
+    JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 3600))
+    # 分离结果缓存: 以输入内容哈希 + 模型为键的持久化索引及其容量上限
+    RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", os.path.join(OUTPUT_DIR, ".result_cache.sqlite3"))
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1000))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 10 * 1024 * 1024 * 1024))  # 10GB
+    # 多 worker 模式: uvicorn worker 数, 是否按 worker 绑定 CPU 组, 每个分离进程的计算线程数(0 为按 CPU 组平分),
+    # 以及 worker 间共享的索引库、指标上报间隔、等待其他 worker 分离结果的轮询间隔与最长等待时间(秒)
+    WORKERS = int(os.getenv("WORKERS", 1))
+    CPU_PINNING = os.getenv("CPU_PINNING", "true").lower() in ("1", "true", "yes")
+    SEPARATION_THREADS = int(os.getenv("SEPARATION_THREADS", 0))
+    SHARED_INDEX_DB = os.getenv("SHARED_INDEX_DB", os.path.join(OUTPUT_DIR, ".shared_index.sqlite3"))
+    SHARED_INDEX_PUBLISH_SECONDS = float(os.getenv("SHARED_INDEX_PUBLISH_SECONDS", 1))
+    SHARED_INDEX_POLL_SECONDS = float(os.getenv("SHARED_INDEX_POLL_SECONDS", 0.5))
+    SHARED_INDEX_INFLIGHT_TIMEOUT = float(os.getenv("SHARED_INDEX_INFLIGHT_TIMEOUT", 1800))
+    # URL 下载: 连接池大小、超时(秒)、重试次数, 以及 Range 分段并行下载的段数与最小段大小
+    DOWNLOAD_POOL_SIZE = int(os.getenv("DOWNLOAD_POOL_SIZE", 100))
+    DOWNLOAD_POOL_PER_HOST = int(os.getenv("DOWNLOAD_POOL_PER_HOST", 16))
+    DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", 10))
+    DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", 60))
+    DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+    DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", 4))
+    DOWNLOAD_SEGMENT_MIN_SIZE = int(os.getenv("DOWNLOAD_SEGMENT_MIN_SIZE", 8 * 1024 * 1024))  # 8MB
 
 settings = Settings()
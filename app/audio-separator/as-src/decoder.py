@@ -0,0 +1,62 @@
+import os
+import json
+import subprocess
+
+from long_input import SAMPLE_RATE
+
+# 解码结果为 44.1kHz 双声道 float32, 每秒音频占用的字节数
+DECODED_BYTES_PER_SECOND = SAMPLE_RATE * 2 * 4
+
+
+def probe_bytes_duration(data: bytes) -> float:
+    """用 ffprobe 从管道估算媒体时长(秒), 无法估算时返回 0
+
+    管道输入无法定位到文件尾, 多数压缩格式(如 MP3)读不到时长, 此时按码率与字节数估算。
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration,bit_rate:stream=bit_rate",
+             "-of", "json", "-i", "pipe:0"],
+            input=data, capture_output=True
+        )
+        info = json.loads(result.stdout or b"{}")
+    except (OSError, ValueError):
+        return 0.0
+    fields = dict(info.get("format") or {})
+    for stream in info.get("streams") or []:
+        fields.setdefault("bit_rate", stream.get("bit_rate"))
+    for key, estimate in (("duration", lambda v: v), ("bit_rate", lambda v: len(data) * 8 / v)):
+        try:
+            value = float(fields.get(key))
+        except (TypeError, ValueError):
+            continue
+        if value > 0:
+            return estimate(value)
+    return 0.0
+
+
+def decode_to_wav_file(data: bytes, wav_path: str, max_bytes: int) -> bool:
+    """通过 ffmpeg 管道将媒体字节解码为 44.1kHz 双声道 float32 WAV, 由 ffmpeg 直接写入 wav_path
+
+    输入不落盘, 解码结果也不经 Python 缓冲。按时长预估的解码大小超过 max_bytes、实际输出达到 max_bytes,
+    或需要随机访问的容器(如 moov 在文件尾的 MP4)无法从管道解码时, 删除输出并返回 False。
+    """
+    if probe_bytes_duration(data) * DECODED_BYTES_PER_SECOND > max_bytes:
+        return False
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", "pipe:0", "-vn", "-map_metadata", "-1",
+         "-ac", "2", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_f32le", "-fs", str(max_bytes), "-f", "wav", wav_path],
+        input=data, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    # 时长未知或预估偏小时由 -fs 截断, 截断的输出同样视为过大
+    size = os.path.getsize(wav_path) if os.path.exists(wav_path) else 0
+    if result.returncode != 0 or size <= 44 or size >= max_bytes:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+        return False
+    return True
+
+
+def write_bytes(file_path: str, data: bytes):
+    with open(file_path, "wb") as f:
+        f.write(data)
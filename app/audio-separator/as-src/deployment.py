@@ -0,0 +1,72 @@
+import os
+
+from config import settings
+
+# 控制数值计算库线程池大小的环境变量, 分离进程以 spawn 启动时继承
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def cpu_sets(workers: int):
+    """把当前可用的 CPU 按顺序均分成 workers 组, 余数分给靠前的组"""
+    cpus = sorted(os.sched_getaffinity(0))
+    workers = max(1, min(workers, len(cpus)))
+    size, extra = divmod(len(cpus), workers)
+    sets = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cpus[start:end])
+        start = end
+    return sets
+
+
+def configure_worker(slot: int) -> dict:
+    """多 worker 模式下按槽位绑定 CPU 组, 并把组内核数平分给本 worker 的分离进程作为计算线程数"""
+    cpus = sorted(os.sched_getaffinity(0))
+    if settings.CPU_PINNING and hasattr(os, "sched_setaffinity"):
+        sets = cpu_sets(settings.WORKERS)
+        cpus = sets[slot % len(sets)]
+        os.sched_setaffinity(0, cpus)
+    threads = settings.SEPARATION_THREADS or max(1, len(cpus) // max(1, settings.SEPARATION_WORKERS))
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    return {"slot": slot, "cpus": cpus, "threads": threads}
+
+
+def apply_thread_limit():
+    """分离进程初始化时按继承的环境变量限制 torch 与 onnxruntime 的线程数
+
+    MDX 模型经 onnxruntime 推理, Separator 以默认 SessionOptions 创建 InferenceSession, 不读取 OMP_NUM_THREADS,
+    因此替换 onnxruntime.InferenceSession, 为未指定线程数的会话填入本进程的线程数。
+    """
+    threads = os.environ.get("OMP_NUM_THREADS")
+    if not threads:
+        return
+    threads = int(threads)
+    try:
+        import torch
+    except ImportError:
+        pass
+    else:
+        torch.set_num_threads(threads)
+    try:
+        import onnxruntime
+    except ImportError:
+        return
+    if getattr(onnxruntime.InferenceSession, "thread_limit", None) is not None:
+        return
+
+    class ThreadLimitedSession(onnxruntime.InferenceSession):
+        thread_limit = threads
+
+        def __init__(self, path_or_bytes, sess_options=None, *args, **kwargs):
+            if sess_options is None:
+                sess_options = onnxruntime.SessionOptions()
+            # 0 为 onnxruntime 默认值(按全部物理核创建线程池)
+            if not sess_options.intra_op_num_threads:
+                sess_options.intra_op_num_threads = self.thread_limit
+            if not sess_options.inter_op_num_threads:
+                sess_options.inter_op_num_threads = 1
+            super().__init__(path_or_bytes, sess_options, *args, **kwargs)
+
+    onnxruntime.InferenceSession = ThreadLimitedSession
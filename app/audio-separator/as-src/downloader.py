@@ -0,0 +1,166 @@
+import os
+import re
+import math
+import asyncio
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+from config import settings
+from ingest import CHUNK_SIZE, InputFile, check_file_size, stream_to_file, hash_file
+
+# Content-Range: bytes 0-0/12345
+CONTENT_RANGE_RE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+
+
+class HttpDownloader:
+    """进程内共享的 HTTP 下载器
+
+    复用同一个连接池(含 DNS 缓存); 服务端支持 Range 时按段并行下载,
+    连接中断时从已写入的位置续传。
+    """
+
+    def __init__(self):
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        # 会话需在事件循环内创建, 因此延迟到首次使用
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.DOWNLOAD_POOL_SIZE,
+                limit_per_host=settings.DOWNLOAD_POOL_PER_HOST,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=settings.DOWNLOAD_CONNECT_TIMEOUT,
+                sock_read=settings.DOWNLOAD_READ_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get(self, url: str, start: int = None, end: int = None) -> aiohttp.ClientResponse:
+        """发起 GET 请求, 连接失败时按指数退避重试"""
+        headers = {}
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        for attempt in range(settings.DOWNLOAD_RETRIES + 1):
+            try:
+                response = await self.session().get(url, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= settings.DOWNLOAD_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            if response.status not in (200, 206):
+                response.release()
+                raise HTTPException(status_code=response.status, detail="Failed to download file")
+            return response
+
+    async def download(self, url: str, file_path: str) -> InputFile:
+        """下载到 file_path, 返回带哈希的 InputFile"""
+        # 以 0-0 的 Range 请求探测: 206 表示支持分段, 200 则直接按整流读取
+        response = await self._get(url, 0, 0)
+        try:
+            match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+            if response.status == 206 and match:
+                response.release()
+                total = int(match.group(1))
+                check_file_size(total)
+                if total >= 2 * settings.DOWNLOAD_SEGMENT_MIN_SIZE and settings.DOWNLOAD_SEGMENTS > 1:
+                    await self._download_segments(url, file_path, total)
+                    return InputFile(file_path, await hash_file(file_path), total)
+                response = await self._get(url, 0)
+                accept_ranges = True
+            else:
+                check_file_size(response.content_length)
+                accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return await stream_to_file(self._iter_resumable(url, response, accept_ranges), file_path,
+                                        memory_limit=settings.INMEMORY_DECODE_MAX_BYTES)
+        finally:
+            response.release()
+
+    async def _iter_resumable(self, url: str, response: aiohttp.ClientResponse, accept_ranges: bool):
+        """逐块读取响应体; 中途断开且服务端支持 Range 时从断点续传"""
+        offset = 0
+        retries = 0
+        try:
+            while True:
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        offset += len(chunk)
+                        yield chunk
+                    return
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    retries += 1
+                    if not accept_ranges or retries > settings.DOWNLOAD_RETRIES:
+                        raise
+                    response.release()
+                    await asyncio.sleep(0.5 * 2 ** (retries - 1))
+                    response = await self._get(url, offset)
+                    if response.status != 206:
+                        raise HTTPException(status_code=502, detail="Server refused to resume download")
+        finally:
+            response.release()
+
+    async def _download_segments(self, url: str, file_path: str, total: int):
+        """按 Range 并行下载各段, 直接写入预分配文件的对应偏移
+
+        任一段失败时取消并等待其余各段, 且等写线程排空后才关闭 fd,
+        避免已关闭(并可能被复用)的 fd 仍被写入。
+        """
+        segments = min(settings.DOWNLOAD_SEGMENTS, math.ceil(total / settings.DOWNLOAD_SEGMENT_MIN_SIZE))
+        segment_size = math.ceil(total / segments)
+        fd = await asyncio.to_thread(os.open, file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        # 本次下载专用的写线程; 取消协程不会中止已提交的 pwrite, 关闭 fd 前需等它结束
+        writer = ThreadPoolExecutor(max_workers=segments, thread_name_prefix="download-writer")
+        tasks = []
+        try:
+            await asyncio.to_thread(os.ftruncate, fd, total)
+            tasks = [
+                asyncio.create_task(self._download_segment(url, fd, start, min(start + segment_size, total) - 1, writer))
+                for start in range(0, total, segment_size)
+            ]
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.to_thread(writer.shutdown, wait=True)
+            await asyncio.to_thread(os.close, fd)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        await asyncio.to_thread(writer.shutdown, wait=True)
+        await asyncio.to_thread(os.close, fd)
+
+    async def _download_segment(self, url: str, fd: int, start: int, end: int, writer: ThreadPoolExecutor):
+        offset = start
+        retries = 0
+        while offset <= end:
+            response = await self._get(url, offset, end)
+            try:
+                if response.status != 206:
+                    raise HTTPException(status_code=502, detail="Server ignored Range request")
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    chunk = chunk[:end + 1 - offset]
+                    await asyncio.get_running_loop().run_in_executor(writer, os.pwrite, fd, chunk, offset)
+                    offset += len(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            finally:
+                response.release()
+            if offset <= end:
+                # 连接中断或响应不完整, 本段从已写入的位置续传
+                retries += 1
+                if retries > settings.DOWNLOAD_RETRIES:
+                    raise HTTPException(status_code=502, detail="Range download failed")
+                await asyncio.sleep(0.5 * 2 ** (retries - 1))
+
+
+http_downloader = HttpDownloader()
@@ -0,0 +1,110 @@
+import os
+import re
+import uuid
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from metrics import stage_seconds
+
+# 输出格式 -> (扩展名, ffmpeg 封装格式, 编码参数, 是否有损); wav 为分离器原始输出, 不再编码
+OUTPUT_FORMATS = {
+    "wav": ("wav", None, None, False),
+    "flac": ("flac", "flac", ["-c:a", "flac"], False),
+    "opus": ("opus", "ogg", ["-c:a", "libopus"], True),
+    "mp3": ("mp3", "mp3", ["-c:a", "libmp3lame"], True),
+}
+
+BITRATE_PATTERN = re.compile(r"^\d{2,3}k$")
+
+
+class OutputEncoder:
+    """在后台线程池中用 ffmpeg 将分离出的 WAV 编码为压缩格式
+
+    编码在主进程的线程中进行, 分离工作进程返回 WAV 后即可处理下一个请求。
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = settings.ENCODER_WORKERS if max_workers is None else max_workers
+        self._pool = None
+        # 输出文件名 -> 进行中的编码, 同一输出的并发请求共用一次编码
+        self._inflight = {}
+
+    @staticmethod
+    def resolve(output_format: str = None, bitrate: str = None):
+        """校验并补全输出格式与码率, 无损格式的码率为 None"""
+        output_format = (output_format or settings.OUTPUT_FORMAT).lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}, expected one of {list(OUTPUT_FORMATS)}")
+        if not OUTPUT_FORMATS[output_format][3]:
+            return output_format, None
+        bitrate = (bitrate or settings.OUTPUT_BITRATE).lower()
+        if not BITRATE_PATTERN.match(bitrate):
+            raise ValueError(f"Invalid bitrate: {bitrate}, expected e.g. 128k")
+        return output_format, bitrate
+
+    @staticmethod
+    def variant(model: str, output_format: str, bitrate: str = None) -> str:
+        """结果缓存中编码产物的模型标识, 使不同格式/码率各自缓存"""
+        if output_format == "wav":
+            return model
+        return f"{model}|{output_format}|{bitrate}" if bitrate else f"{model}|{output_format}"
+
+    @staticmethod
+    def output_name(file: str, output_format: str, bitrate: str = None) -> str:
+        extension = OUTPUT_FORMATS[output_format][0]
+        stem = os.path.splitext(file)[0]
+        return f"{stem}_{bitrate}.{extension}" if bitrate else f"{stem}.{extension}"
+
+    def _encode_file(self, file: str, output_format: str, bitrate: str = None) -> str:
+        """编码单个输出文件, 先写临时文件再改名, 避免静态服务读到半成品
+
+        临时文件名带随机后缀, 其他 worker 进程同时编码同一输出时互不覆盖。
+        """
+        _, muxer, codec_args, _ = OUTPUT_FORMATS[output_format]
+        output_file = self.output_name(file, output_format, bitrate)
+        output_path = os.path.join(settings.OUTPUT_DIR, output_file)
+        part_path = f"{output_path}.{uuid.uuid4().hex[:8]}.part"
+        command = ["ffmpeg", "-y", "-v", "error", "-i", os.path.join(settings.OUTPUT_DIR, file), "-vn"] + codec_args
+        if bitrate:
+            command += ["-b:a", bitrate]
+        command += ["-f", muxer, part_path]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode != 0:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise RuntimeError(f"Failed to encode {file} as {output_format}: {result.stderr.decode(errors='ignore').strip()}")
+        os.replace(part_path, output_path)
+        return output_file
+
+    async def encode(self, output_files, output_format: str, bitrate: str = None, model: str = None):
+        """编码全部输出文件, 返回编码后的文件名列表; wav 原样返回"""
+        if output_format == "wav":
+            return output_files
+        with stage_seconds.time(stage="encode", model=model):
+            return list(await asyncio.gather(*[
+                self._encode_shared(file, output_format, bitrate) for file in output_files
+            ]))
+
+    async def _encode_shared(self, file: str, output_format: str, bitrate: str = None) -> str:
+        """同一输出文件已在编码时等待该次编码, 否则提交到编码线程池"""
+        output_file = self.output_name(file, output_format, bitrate)
+        future = self._inflight.get(output_file)
+        if future is None:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="encoder")
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, self._encode_file, file, output_format, bitrate)
+            self._inflight[output_file] = future
+            future.add_done_callback(lambda _: self._inflight.pop(output_file, None))
+        # shield: 某个请求被取消时不影响共用这次编码的其他请求
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+output_encoder = OutputEncoder()
@@ -0,0 +1,215 @@
+import os
+import time
+import queue
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from config import settings
+from metrics import registry, Gauge, stage_seconds, model_loads
+
+# 工作进程内的处理器, 每个进程各自持有 Separator, 互不共享
+_worker_processor = None
+
+
+def _init_worker(preload_models=(), ready_queue=None):
+    """工作进程初始化: 创建本进程独立的处理器, 预加载、预热指定模型, 完成后经 ready_queue 通知主进程"""
+    global _worker_processor
+    from deployment import apply_thread_limit
+    from processor import AudioSeparatorProcessor
+    apply_thread_limit()
+    _worker_processor = AudioSeparatorProcessor()
+    for model in preload_models:
+        try:
+            _worker_processor.warm_up(model)
+        except Exception as e:
+            # 预热失败不影响进程启动, 该模型在首个请求时再加载
+            import logger
+            logger.CustomLogger().warning(f"Warm-up failed - model: {model}, error: {e}")
+    if ready_queue is not None:
+        ready_queue.put((os.getpid(), _worker_processor.model_cache.stats()))
+
+
+def _worker_status():
+    return os.getpid(), _worker_processor.model_cache.stats()
+
+
+def _run_separation_batch(model: str, items, submitted_at: float):
+    """在工作进程中依次分离同一模型的一批输入, 同时带回各阶段耗时与本进程的模型缓存统计
+
+    单个请求失败不影响同批其他请求, 异常作为该请求的结果返回。
+    """
+    results = []
+    timings = []
+    queue_time = time.time() - submitted_at
+    for input_file, request_id in items:
+        _worker_processor.last_timings = {}
+        try:
+            results.append(_worker_processor.process_audio(input_file, model, request_id))
+        except Exception as e:
+            results.append(e)
+        timings.append(dict(_worker_processor.last_timings, queue=queue_time))
+    return results, timings, os.getpid(), _worker_processor.model_cache.stats()
+
+
+class QueueFullError(Exception):
+    """分离队列已满"""
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        super().__init__(f"Separation queue is full ({depth} requests pending)")
+
+
+class SeparationExecutor:
+    """把 CPU 密集的分离任务派发到有界的进程池, 避免阻塞事件循环"""
+
+    def __init__(self, max_workers: int = None, max_queue: int = None):
+        self.max_workers = settings.SEPARATION_WORKERS if max_workers is None else max_workers
+        self.max_queue = settings.SEPARATION_QUEUE_SIZE if max_queue is None else max_queue
+        self._pool = None
+        # 工作进程完成初始化(含预热)后在此上报 (pid, 模型缓存统计)
+        self._ready_queue = None
+        # 已提交但未完成的任务数(运行中 + 排队中)
+        self.pending = 0
+        # 已提交但未完成的进程池任务数, 一个批量任务计为 1
+        self.running = 0
+        # 任一进程池任务结束(有工作进程空闲)时调用的回调
+        self._idle_listeners = []
+        # pid -> 该工作进程最近一次上报的模型缓存统计
+        self._cache_stats = {}
+        # 所有工作进程完成预加载与预热后置为 True
+        self.ready = False
+        # 新建工作进程时预加载的模型, 预热失败后清空
+        self._preload_models = tuple(settings.PRELOAD_MODELS)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def idle_workers(self) -> int:
+        return max(0, self.max_workers - self.running)
+
+    def add_idle_listener(self, callback):
+        self._idle_listeners.append(callback)
+
+    def start(self):
+        if self._pool is None:
+            # 使用 spawn 避免 fork 继承 CUDA/ONNX 运行时状态
+            context = multiprocessing.get_context("spawn")
+            self._ready_queue = context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._preload_models, self._ready_queue)
+            )
+
+    async def warm_up(self):
+        """启动全部工作进程并等待每个进程完成模型预热
+
+        进程按需创建, 同时提交 max_workers 个任务即可拉起所有进程; 每个进程初始化完成后各自经
+        ready_queue 上报一次, 收齐 max_workers 个进程的上报才置为就绪。
+
+        工作进程在上报前退出(如预热时内存不足)会使进程池损坏, 此时换用不预加载模型的新进程池;
+        超过 WARMUP_TIMEOUT_SECONDS 仍未收齐时不再等待。两种情况都直接置为就绪, 模型在首个请求时加载。
+        """
+        import logger
+        self.start()
+        ready_queue = self._ready_queue
+        spawn = asyncio.gather(*[self.submit(_worker_status) for _ in range(self.max_workers)])
+        # 超时后不再等待的任务可能随后失败, 取走其异常避免未处理告警
+        spawn.add_done_callback(lambda future: future.cancelled() or future.exception())
+        ready_pids = set()
+        deadline = time.monotonic() + settings.WARMUP_TIMEOUT_SECONDS
+        try:
+            while len(ready_pids) < self.max_workers:
+                if spawn.done():
+                    # 进程池损坏时任务以 BrokenProcessPool 结束, 不会再有进程上报
+                    spawn.result()
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{len(ready_pids)}/{self.max_workers} workers ready "
+                                       f"after {settings.WARMUP_TIMEOUT_SECONDS}s")
+                try:
+                    # 带超时等待, 任务被取消时后台线程能及时退出
+                    pid, cache_stats = await asyncio.to_thread(ready_queue.get, True, 1)
+                except queue.Empty:
+                    continue
+                ready_pids.add(pid)
+                self._cache_stats[pid] = cache_stats
+            await spawn
+        except TimeoutError as e:
+            # 进程仍在预热, 请求在进程池中排队等待
+            logger.CustomLogger().warning(f"Warm-up timed out, serving without waiting - error: {e}")
+        except Exception as e:
+            logger.CustomLogger().error(f"Warm-up failed, models will load on first request - error: {e!r}")
+            self._preload_models = ()
+            self.shutdown()
+            self.start()
+        except BaseException:
+            spawn.cancel()
+            raise
+        self.ready = True
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def submit(self, fn, *args, weight: int = 1):
+        """提交任务到进程池, 队列已满时抛出 QueueFullError
+
+        weight 为该任务包含的请求数, 批量任务按请求数占用队列容量。
+        """
+        if self.pending + weight > self.capacity and self.pending > 0:
+            raise QueueFullError(self.pending)
+        self.start()
+        self.pending += weight
+        self.running += 1
+        try:
+            return await asyncio.wrap_future(self._pool.submit(fn, *args))
+        finally:
+            self.pending -= weight
+            self.running -= 1
+            for callback in self._idle_listeners:
+                callback()
+
+    async def separate_batch(self, model: str, items):
+        """分离同一模型的一批 (input_file, request_id), 按顺序返回各自的输出文件或异常"""
+        results, timings, pid, cache_stats = await self.submit(
+            _run_separation_batch, model, items, time.time(), weight=len(items))
+        self._cache_stats[pid] = cache_stats
+        for item_timings in timings:
+            for stage in ("queue", "load_model", "separate"):
+                if stage in item_timings:
+                    stage_seconds.observe(item_timings[stage], stage=stage, model=model)
+            if item_timings.get("model_loaded"):
+                model_loads.inc(model=model)
+        return results
+
+    def model_cache_stats(self) -> dict:
+        """汇总各工作进程的模型缓存统计"""
+        stats = {
+            "models": [],
+            "resident_bytes": 0,
+            "max_bytes": settings.MODEL_CACHE_MAX_BYTES,
+            "max_models": settings.MODEL_CACHE_MAX_MODELS,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "workers": len(self._cache_stats),
+        }
+        for worker_stats in self._cache_stats.values():
+            for model in worker_stats["models"]:
+                if model not in stats["models"]:
+                    stats["models"].append(model)
+            for key in ("resident_bytes", "hits", "misses", "evictions"):
+                stats[key] += worker_stats[key]
+        return stats
+
+
+separation_executor = SeparationExecutor()
+
+registry.register(Gauge(
+    "audio_separator_separation_pending", "Separation requests queued or running in the process pool",
+    function=lambda: separation_executor.pending))
@@ -0,0 +1,99 @@
+import os
+import asyncio
+import hashlib
+from fastapi import HTTPException
+
+from config import settings
+
+# 流式写入临时文件时的分块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+class InputFile:
+    """请求的输入, 附带内容哈希
+
+    data 不为空时输入仍在内存中, 尚未写入 path; duration 在解码后才已知。
+    """
+
+    def __init__(self, path: str, sha256: str, size: int, data: bytes = None, duration: float = None):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.data = data
+        self.duration = duration
+
+
+def check_file_size(size):
+    """超过 MAX_FILE_SIZE 时抛出 413"""
+    if size is not None and size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File size exceeds maximum allowed size")
+
+
+def _write_chunk(f, sha256, chunk: bytes):
+    # hashlib 与文件写入都会释放 GIL, 放在线程中执行不占用事件循环
+    sha256.update(chunk)
+    f.write(chunk)
+
+
+async def iter_upload_chunks(file):
+    """按块读取 UploadFile"""
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def stream_to_file(chunks, file_path: str, memory_limit: int = 0) -> InputFile:
+    """将异步分块流写入文件, 同一遍完成大小校验与哈希计算
+
+    磁盘写入在线程中执行; 累计大小超过 MAX_FILE_SIZE 时立即中止并删除已写入部分。
+    memory_limit > 0 时先在内存中缓冲, 超过该大小才溢出写入 file_path;
+    未超过时文件不会创建, 内容放在返回值的 data 中。
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    buffer = bytearray() if memory_limit > 0 else None
+    f = None
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            check_file_size(size)
+            if buffer is not None:
+                if size <= memory_limit:
+                    await asyncio.to_thread(sha256.update, chunk)
+                    buffer += chunk
+                    continue
+                # 超出内存缓冲上限, 已缓冲部分先写入文件, 之后直接落盘
+                f = await asyncio.to_thread(open, file_path, "wb")
+                await asyncio.to_thread(f.write, buffer)
+                buffer = None
+            if f is None:
+                f = await asyncio.to_thread(open, file_path, "wb")
+            await asyncio.to_thread(_write_chunk, f, sha256, chunk)
+    except BaseException:
+        if f is not None:
+            await asyncio.to_thread(f.close)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    if f is not None:
+        await asyncio.to_thread(f.close)
+    data = bytes(buffer) if buffer is not None else None
+    return InputFile(file_path, sha256.hexdigest(), size, data=data)
+
+
+def _hash_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+async def hash_file(file_path: str) -> str:
+    """在线程中计算已落盘文件的哈希(用于分段并行下载的文件)"""
+    return await asyncio.to_thread(_hash_file, file_path)
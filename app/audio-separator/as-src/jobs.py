@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import math
+import uuid
+
+from config import settings
+from metrics import registry, Gauge
+from shared_index import shared_index
+
+
+class Job:
+    """异步分离任务"""
+
+    def __init__(self, job_id: str, work, input_paths=()):
+        self.job_id = job_id
+        # work: 以 job_id 为参数的协程函数, 返回 ApiResponse
+        self.work = work
+        # 提交时已落盘的输入文件, 任务结束前临时目录清理不得删除
+        self.input_paths = [os.path.abspath(path) for path in input_paths]
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+    def __init__(self, depth: int, eta: float = None):
+        self.depth = depth
+        self.eta = eta
+        super().__init__(f"Job queue is full ({depth} jobs queued)")
+
+
+class JobScheduler:
+    """有界任务队列 + 固定数量的执行协程"""
+
+    def __init__(self, max_queue: int = None, concurrency: int = None, result_ttl: int = None):
+        self.max_queue = settings.JOB_QUEUE_SIZE if max_queue is None else max_queue
+        self.concurrency = settings.SEPARATION_WORKERS if concurrency is None else concurrency
+        self.result_ttl = settings.JOB_RESULT_TTL if result_ttl is None else result_ttl
+        self._queue = None
+        self._runners = []
+        self._jobs = {}
+        self.running = 0
+        # 单个任务耗时的指数滑动平均, 用于估算排队时间
+        self._avg_seconds = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def is_full(self) -> bool:
+        return self.depth >= self.max_queue
+
+    def eta(self, position: int = None) -> float:
+        """估算排在 position 的任务完成所需秒数, 尚无历史数据时返回 None"""
+        if self._avg_seconds is None:
+            return None
+        if position is None:
+            position = self.depth
+        return self._avg_seconds * math.ceil((position + 1) / self.concurrency)
+
+    async def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        for _ in range(self.concurrency - len(self._runners)):
+            self._runners.append(asyncio.create_task(self._run()))
+
+    async def stop(self):
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+
+    def submit(self, work, input_paths=()) -> Job:
+        """提交任务, 队列已满时抛出 JobQueueFullError"""
+        self._prune()
+        if self._queue is None or self.is_full():
+            raise JobQueueFullError(self.depth, self.eta())
+        job = Job(uuid.uuid4().hex, work, input_paths)
+        self._queue.put_nowait(job)
+        self._jobs[job.job_id] = job
+        if shared_index.enabled:
+            # 多 worker 模式下任务状态写入共享索引, 查询可落到任意 worker
+            shared_index.save_job(job.job_id, job.status, inputs=job.input_paths)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self._jobs.get(job_id)
+
+    def live_input_paths(self) -> set:
+        """排队或执行中任务的输入文件, 多 worker 模式下包含其他 worker 接收的任务"""
+        paths = {path for job in self._jobs.values() if job.status in ("queued", "running")
+                 for path in job.input_paths}
+        if shared_index.enabled:
+            paths |= shared_index.live_job_inputs()
+        return paths
+
+    def _prune(self):
+        """清理超过保留时间的已完成任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired and shared_index.enabled:
+            shared_index.prune_jobs(self.result_ttl)
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            self.running += 1
+            start_time = time.time()
+            try:
+                if shared_index.enabled:
+                    await asyncio.to_thread(shared_index.save_job, job.job_id, job.status,
+                                            inputs=job.input_paths)
+                job.result = await job.work(job.job_id)
+                job.status = "completed"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                if shared_index.enabled:
+                    result = job.result.model_dump() if job.result is not None else None
+                    await asyncio.to_thread(shared_index.save_job, job.job_id, job.status, result, job.error)
+                self.running -= 1
+                job.finished_at = time.time()
+                elapsed = job.finished_at - start_time
+                if self._avg_seconds is None:
+                    self._avg_seconds = elapsed
+                else:
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                self._queue.task_done()
+
+
+job_scheduler = JobScheduler()
+
+registry.register(Gauge(
+    "audio_separator_jobs_queued", "Asynchronous jobs waiting in the job queue",
+    function=lambda: job_scheduler.depth))
+registry.register(Gauge(
+    "audio_separator_jobs_running", "Asynchronous jobs currently running",
+    function=lambda: job_scheduler.running))
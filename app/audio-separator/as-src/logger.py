@@ -1,33 +1,66 @@
 import os
+import atexit
+import queue
+import random
 import logging
+import logging.handlers
 from datetime import datetime
 
+from config import settings
+
+
+class DailyFileHandler(logging.FileHandler):
+    """按日期切换文件的处理器, 文件路径为 log/YYYY/MM/audio_separatorDD.log"""
+
+    def __init__(self, log_root: str, encoding: str = 'utf-8'):
+        self.log_root = log_root
+        self.current_date = datetime.now().date()
+        super().__init__(self._path_for(self.current_date), encoding=encoding, delay=True)
+
+    def _path_for(self, date) -> str:
+        log_dir = os.path.join(self.log_root, date.strftime('%Y/%m'))
+        os.makedirs(log_dir, exist_ok=True)
+        return os.path.abspath(os.path.join(log_dir, f'audio_separator{date.strftime("%d")}.log'))
+
+    def emit(self, record):
+        # 跨天后关闭旧文件, 下一条日志写入当天的新文件
+        record_date = datetime.fromtimestamp(record.created).date()
+        if record_date != self.current_date:
+            self.current_date = record_date
+            self.close()
+            self.baseFilename = self._path_for(record_date)
+        super().emit(record)
+
 
 class CustomLogger:
+    """异步日志: 请求协程只把记录放入队列, 由后台线程写文件和控制台"""
+
     def __init__(self):
         self.logger = None
+        self.listener = None
+        self.response_sample_rate = settings.LOG_RESPONSE_SAMPLE_RATE
         self.setup_logger()
 
     def setup_logger(self):
-        # 获取当前日期
-        now = datetime.now()
-        year_month = now.strftime('%Y/%m')
-        day = now.strftime('%d')
-
-        # 创建日志目录
-        log_dir = os.path.join('log', year_month)
-        os.makedirs(log_dir, exist_ok=True)
-
-        # 设置日志文件路径
-        log_file = os.path.join(log_dir, f'audio_separator{day}.log')
-
         # 创建logger
         self.logger = logging.getLogger('audio-separator')
         self.logger.setLevel(logging.DEBUG)
+        # 已配置过(同一进程内重复创建)时直接复用
+        if self.logger.handlers:
+            return
 
-        # 创建文件处理器
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
+        # 创建文件处理器: 按天或按大小轮转
+        if settings.LOG_ROTATION == 'size':
+            os.makedirs(settings.LOG_DIR, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(settings.LOG_DIR, 'audio_separator.log'),
+                maxBytes=settings.LOG_MAX_BYTES,
+                backupCount=settings.LOG_BACKUP_COUNT,
+                encoding='utf-8'
+            )
+        else:
+            file_handler = DailyFileHandler(settings.LOG_DIR)
+        file_handler.setLevel(settings.LOG_LEVEL)
 
         # 创建控制台处理器
         console_handler = logging.StreamHandler()
@@ -40,10 +73,24 @@ class CustomLogger:
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        # 添加处理器
-        if not self.logger.handlers:
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
+        # 请求路径只做入队, 文件与控制台输出由监听线程完成
+        log_queue = queue.Queue(-1)
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止监听线程并写完队列中剩余的日志"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def should_log_response(self) -> bool:
+        """按 LOG_RESPONSE_SAMPLE_RATE 抽样记录完整的响应体"""
+        return random.random() < self.response_sample_rate
 
     def debug(self, message):
         self.logger.debug(message)
@@ -0,0 +1,171 @@
+import os
+import asyncio
+import struct
+import subprocess
+import numpy as np
+import soundfile as sf
+
+from config import settings
+
+# 分离模型的工作采样率, 与 Separator 默认的 sample_rate 一致
+SAMPLE_RATE = 44100
+
+
+def probe_duration(input_path: str) -> float:
+    """用 ffprobe 读取媒体时长(秒), 无法识别时返回 0"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", input_path],
+            capture_output=True, text=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return 0.0
+
+
+def decode_to_wav(input_path: str, wav_path: str):
+    """用 ffmpeg 将输入解码为 44.1kHz 双声道 float32 WAV"""
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", input_path, "-vn",
+         "-ac", "2", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_f32le", wav_path],
+        check=True
+    )
+
+
+def open_wav_memmap(wav_path: str) -> np.memmap:
+    """以内存映射方式打开 float32 WAV 的 data 块, 返回 (帧数, 声道数) 的数组"""
+    with open(wav_path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"Not a WAV file: {wav_path}")
+        channels = 2
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"WAV data chunk not found: {wav_path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size + chunk_size % 2)
+                channels = struct.unpack("<H", fmt[2:4])[0]
+            elif chunk_id == b"data":
+                offset = f.tell()
+                frames = chunk_size // (4 * channels)
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    return np.memmap(wav_path, dtype="<f4", mode="r", offset=offset, shape=(frames, channels))
+
+
+def plan_windows(total_frames: int, window_frames: int, overlap_frames: int):
+    """按固定窗长切分, 相邻窗口重叠 overlap_frames, 返回 [(start, end), ...]"""
+    windows = []
+    for start in range(0, total_frames, window_frames):
+        # 上一个窗口已覆盖到 start + overlap, 剩余部分不足时不再单独成窗
+        if start > 0 and total_frames <= start + overlap_frames:
+            break
+        windows.append((start, min(start + window_frames + overlap_frames, total_frames)))
+    return windows
+
+
+class CrossfadeStitcher:
+    """顺序接收各窗口的分离结果, 在重叠区做线性交叉淡化后输出已确定的片段
+
+    只保留上一个窗口的重叠尾部, 内存占用与输入总长无关。
+    """
+
+    def __init__(self, overlap_frames: int):
+        self.overlap_frames = overlap_frames
+        self._tail = None
+
+    def push(self, window: np.ndarray, final: bool = False) -> np.ndarray:
+        """传入下一个窗口, 返回可以确定的片段; final 为 True 时连同尾部一起返回"""
+        window = np.asarray(window, dtype=np.float32)
+        if self._tail is not None:
+            n = min(len(self._tail), len(window))
+            fade_in = np.linspace(0.0, 1.0, n, dtype=np.float32)[:, None]
+            window = window.copy()
+            window[:n] = self._tail[:n] * (1.0 - fade_in) + window[:n] * fade_in
+        if not final and self.overlap_frames and len(window) > self.overlap_frames:
+            self._tail = window[-self.overlap_frames:]
+            return window[:-self.overlap_frames]
+        self._tail = None
+        return window
+
+    def finish(self) -> np.ndarray:
+        tail, self._tail = self._tail, None
+        return tail
+
+
+class LongInputJob:
+    """长输入的分窗分离: 解码为内存映射 WAV, 按窗并行分离, 再按顺序拼接"""
+
+    def __init__(self, input_path: str, request_id: str):
+        self.input_path = input_path
+        self.request_id = request_id
+        self.wav_path = os.path.join(settings.TEMP_DIR, f"{request_id}_decoded.wav")
+        self.window_frames = int(settings.LONG_INPUT_WINDOW_SECONDS * SAMPLE_RATE)
+        self.overlap_frames = int(settings.LONG_INPUT_OVERLAP_SECONDS * SAMPLE_RATE)
+        self.audio = None
+        self.windows = []
+        # 分离结果的采样率与位深, 由第一个窗口的输出决定
+        self.output_samplerate = SAMPLE_RATE
+        self.output_subtype = None
+
+    def prepare(self):
+        decode_to_wav(self.input_path, self.wav_path)
+        self.audio = open_wav_memmap(self.wav_path)
+        self.windows = plan_windows(len(self.audio), self.window_frames, self.overlap_frames)
+
+    def _write_window(self, index: int) -> str:
+        start, end = self.windows[index]
+        window_path = os.path.join(settings.TEMP_DIR, f"{self.request_id}_w{index}.wav")
+        sf.write(window_path, self.audio[start:end], SAMPLE_RATE, subtype="FLOAT")
+        return window_path
+
+    def _read_output(self, output_file: str) -> np.ndarray:
+        output_path = os.path.join(settings.OUTPUT_DIR, output_file)
+        data, samplerate = sf.read(output_path, dtype="float32", always_2d=True)
+        if self.output_subtype is None:
+            self.output_samplerate = samplerate
+            self.output_subtype = sf.info(output_path).subtype
+        os.remove(output_path)
+        return data
+
+    async def iter_segments(self, separate_window):
+        """按时间顺序产出拼接后的片段
+
+        separate_window(window_path, window_request_id) 为分离单个窗口的协程,
+        返回输出文件名列表; 同时在途的窗口数不超过 LONG_INPUT_PARALLELISM。
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.LONG_INPUT_PARALLELISM))
+
+        async def run_window(index: int):
+            async with semaphore:
+                window_path = await asyncio.to_thread(self._write_window, index)
+                try:
+                    return await separate_window(window_path, f"{self.request_id}_w{index}")
+                finally:
+                    os.remove(window_path)
+
+        tasks = [asyncio.create_task(run_window(i)) for i in range(len(self.windows))]
+        stitcher = CrossfadeStitcher(self.overlap_frames)
+        try:
+            for index, task in enumerate(tasks):
+                output_files = await task
+                window = await asyncio.to_thread(self._read_output, output_files[0])
+                segment = stitcher.push(window, final=index == len(tasks) - 1)
+                if len(segment):
+                    yield segment
+            tail = stitcher.finish()
+            if tail is not None and len(tail):
+                yield tail
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cleanup(self):
+        self.audio = None
+        if os.path.exists(self.wav_path):
+            os.remove(self.wav_path)
@@ -2,11 +2,52 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
-from routes import router
+import asyncio
+import argparse
+from contextlib import asynccontextmanager
+import logger
+from routes import router, collect_worker_stats
 from config import settings
+from executor import separation_executor
+from jobs import job_scheduler
+from downloader import http_downloader
+from encoder import output_encoder
+from retention import storage_sweeper
+from shared_index import shared_index
+from deployment import configure_worker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    publisher = None
+    if shared_index.enabled:
+        # 多 worker 模式: 领取槽位, 按槽位绑定 CPU 组并划分计算线程; 须在启动分离进程之前完成, 子进程随之继承
+        slot = await asyncio.to_thread(shared_index.claim_slot, settings.WORKERS)
+        placement = configure_worker(slot)
+        logger.CustomLogger().info(
+            f"Worker started - pid: {os.getpid()}, slot: {slot}, cpus: {placement['cpus']}, threads: {placement['threads']}")
+        publisher = asyncio.create_task(shared_index.run_publisher(collect_worker_stats))
+    # 启动分离进程池, 退出时关闭; 模型预热在后台进行, 完成前 /ready 返回 503
+    separation_executor.start()
+    warm_up_task = asyncio.create_task(separation_executor.warm_up())
+    await job_scheduler.start()
+    # 输出目录与临时目录的清理只由一个 worker 负责
+    if shared_index.slot in (None, 0):
+        await storage_sweeper.start()
+    yield
+    warm_up_task.cancel()
+    if publisher is not None:
+        publisher.cancel()
+    await storage_sweeper.stop()
+    await job_scheduler.stop()
+    separation_executor.shutdown()
+    output_encoder.shutdown()
+    await http_downloader.close()
+    await asyncio.to_thread(shared_index.release_slot)
+
 
 # 初始化 fastapi
-app = FastAPI(title="Audio Separator API", version="1.0.0")
+app = FastAPI(title="Audio Separator API", version="1.0.0", lifespan=lifespan)
 
 # cors 中间件
 app.add_middleware(
@@ -24,7 +65,8 @@ app.include_router(router)
 dirs_to_check = [
     settings.MODEL_DIR,
     settings.OUTPUT_DIR,
-    settings.TEMP_DIR
+    settings.TEMP_DIR,
+    settings.INMEMORY_DIR
 ]
 
 for directory in dirs_to_check:
@@ -36,4 +78,19 @@ for directory in dirs_to_check:
 
 # 启动服务
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=settings.PORT)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preload-models", default=None, help="启动时预加载并预热的模型, 逗号分隔, 默认取 PRELOAD_MODELS")
+    parser.add_argument("--workers", type=int, default=None, help="uvicorn worker 数, 默认取 WORKERS")
+    args = parser.parse_args()
+    if args.preload_models is not None:
+        # 通过环境变量传递, spawn 出的分离进程重新导入 config 时同样生效
+        os.environ["PRELOAD_MODELS"] = args.preload_models
+        settings.PRELOAD_MODELS = [m.strip() for m in args.preload_models.split(",") if m.strip()]
+    if args.workers is not None:
+        os.environ["WORKERS"] = str(args.workers)
+        settings.WORKERS = args.workers
+    if settings.WORKERS > 1:
+        # 多 worker 需以导入字符串启动, 各 worker 重新导入本模块并从环境变量读取配置
+        uvicorn.run("main:app", host="0.0.0.0", port=settings.PORT, workers=settings.WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=settings.PORT)
@@ -0,0 +1,203 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# 默认的耗时分桶(秒), 覆盖从毫秒级上传到数分钟的长音频分离
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        """返回 [(指标名后缀, 标签值, 额外标签, 数值), ...]"""
+        with self._lock:
+            values = dict(self._values)
+        return self._samples(values)
+
+    def _samples(self, values: dict):
+        return [("", key, None, value) for key, value in values.items()]
+
+    def snapshot(self):
+        """可 JSON 序列化的当前取值, 供多 worker 汇总"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge_value(a, b):
+        return a + b
+
+    def merge(self, snapshots) -> dict:
+        """合并多个 worker 的快照, 计数与在途量均按标签求和"""
+        values = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = self.merge_value(values[key], value) if key in values else value
+        return values
+
+    def render(self, values: dict = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        samples = self.samples() if values is None else self._samples(values)
+        for suffix, key, extra, value in samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        # 设置 function 时在采集时取值, 适合队列深度这类已有状态
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        if self.function is not None:
+            return [("", (), None, self.function())]
+        return super().samples()
+
+    def snapshot(self):
+        if self.function is not None:
+            return [[[], self.function()]]
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: dict(entry, buckets=list(entry["buckets"])) for key, entry in self._values.items()}
+        return self._samples(values)
+
+    def _samples(self, values: dict):
+        samples = []
+        for key, entry in values.items():
+            for bound, count in zip(self.buckets, entry["buckets"]):
+                samples.append(("_bucket", key, ("le", bound), count))
+            samples.append(("_bucket", key, ("le", "+Inf"), entry["count"]))
+            samples.append(("_sum", key, None, entry["sum"]))
+            samples.append(("_count", key, None, entry["count"]))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), dict(entry, buckets=list(entry["buckets"]))] for key, entry in self._values.items()]
+
+    @staticmethod
+    def merge_value(a, b):
+        return {
+            "buckets": [x + y for x, y in zip(a["buckets"], b["buckets"])],
+            "sum": a["sum"] + b["sum"],
+            "count": a["count"] + b["count"],
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots=None) -> str:
+        """Prometheus 文本格式; 传入多个 worker 的快照时输出汇总值"""
+        if snapshots is None:
+            return "\n".join(metric.render() for metric in self._metrics) + "\n"
+        return "\n".join(metric.render(metric.merge([snapshot.get(metric.name, []) for snapshot in snapshots]))
+                         for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 各阶段耗时: download / upload / decode / queue / load_model / separate / cleanup
+stage_seconds = registry.register(Histogram(
+    "audio_separator_stage_seconds", "Time spent in each request stage", ("stage", "model")))
+requests_in_flight = registry.register(Gauge(
+    "audio_separator_requests_in_flight", "Requests currently being handled"))
+requests_total = registry.register(Counter(
+    "audio_separator_requests_total", "Finished separation requests", ("model", "status")))
+ingested_bytes = registry.register(Counter(
+    "audio_separator_ingested_bytes_total", "Input bytes received from uploads and downloads", ("source",)))
+model_loads = registry.register(Counter(
+    "audio_separator_model_loads_total", "Models loaded by separation workers", ("model",)))
+result_cache_hits = registry.register(Counter(
+    "audio_separator_result_cache_hits_total", "Requests answered from the result cache", ("model",)))
@@ -0,0 +1,96 @@
+import os
+import gc
+import threading
+from collections import OrderedDict
+
+from config import settings
+from audio_separator.separator import Separator
+
+
+class ModelCache:
+    """按模型文件名缓存已加载模型的 Separator, 超出内存预算时按 LRU 淘汰"""
+
+    def __init__(self, max_bytes: int = None, max_models: int = None):
+        self.max_bytes = settings.MODEL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_models = settings.MODEL_CACHE_MAX_MODELS if max_models is None else max_models
+        # model_filename -> (separator, 估算内存大小)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _create_separator(self) -> Separator:
+        if settings.SEPARATOR_STUB:
+            # 压测模式: 不加载模型权重
+            from stub_separator import StubSeparator
+            return StubSeparator(output_dir=settings.OUTPUT_DIR)
+        return Separator(
+            output_single_stem="Vocals",
+            model_file_dir=settings.MODEL_DIR,
+            output_dir=settings.OUTPUT_DIR,
+            # MDX 模型单次推理的分段数, 增大可提升 CPU 吞吐
+            mdx_params={
+                "hop_length": 1024,
+                "segment_size": 256,
+                "overlap": 0.25,
+                "batch_size": settings.SEPARATION_BATCH_SIZE,
+                "enable_denoise": False,
+            }
+        )
+
+    def _estimate_size(self, model: str) -> int:
+        """以模型文件大小估算常驻内存, 文件不存在时按 0 计"""
+        try:
+            return os.path.getsize(os.path.join(settings.MODEL_DIR, model))
+        except OSError:
+            return 0
+
+    def get(self, model: str) -> Separator:
+        """返回已加载指定模型的 Separator, 未命中时加载并放入缓存"""
+        with self._lock:
+            entry = self._entries.get(model)
+            if entry is not None:
+                self._entries.move_to_end(model)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        separator = self._create_separator()
+        separator.load_model(model_filename=model)
+        size = self._estimate_size(model)
+
+        with self._lock:
+            if model not in self._entries:
+                self._entries[model] = (separator, size)
+                self._total_bytes += size
+            self._entries.move_to_end(model)
+            self._evict()
+            return self._entries[model][0]
+
+    def _evict(self):
+        """淘汰最久未使用的模型, 至少保留最近使用的一个"""
+        evicted = False
+        while len(self._entries) > 1 and (
+                self._total_bytes > self.max_bytes or len(self._entries) > self.max_models):
+            _, (separator, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            if separator.model_instance is not None:
+                separator.model_instance.clear_gpu_cache()
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": list(self._entries.keys()),
+                "resident_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_models": self.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional, Union
 
 # 定义 api 返回体结构
 class ApiResponse(BaseModel):
@@ -7,3 +7,55 @@ class ApiResponse(BaseModel):
     output_files: List[str]
     request_id: str = Field(..., description="Unique request ID")
     processing_time: float = Field(..., description="Processing time in seconds")
+
+
+# 批量分离中单个条目的结果
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    source: str = Field(..., description="Uploaded filename or url")
+    success: bool
+    message: str
+    output_files: List[str]
+    request_id: str
+    processing_time: float
+
+
+# 批量分离返回体
+class BatchResponse(BaseModel):
+    message: str
+    results: List[BatchItemResult]
+    request_id: str = Field(..., description="Unique batch request ID")
+    processing_time: float = Field(..., description="Processing time in seconds")
+
+
+# 模型缓存统计
+class ModelCacheStats(BaseModel):
+    models: List[str]
+    resident_bytes: int
+    max_bytes: int
+    max_models: int
+    hits: int
+    misses: int
+    evictions: int
+    workers: int = Field(0, description="Number of separation workers reporting")
+
+
+# 分离结果缓存统计
+class ResultCacheStats(BaseModel):
+    entries: int
+    total_bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+# 异步任务状态
+class JobResponse(BaseModel):
+    job_id: Optional[str] = Field(None, description="Job ID, empty when the job was rejected")
+    status: str = Field(..., description="queued / running / completed / failed / rejected")
+    message: str = ""
+    queue_depth: int = Field(0, description="Number of jobs waiting in the queue")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds until completion")
+    result: Optional[Union[ApiResponse, BatchResponse]] = None
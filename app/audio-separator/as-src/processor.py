@@ -1,55 +1,268 @@
 import os
+import time
 import uuid
-import aiohttp
-from fastapi import HTTPException
+import asyncio
+import numpy as np
+import soundfile as sf
 
 from config import settings
-from audio_separator.separator import Separator
-
+from model_cache import ModelCache
+from batcher import micro_batcher
+from executor import separation_executor
+from result_cache import result_cache
+from ingest import InputFile, check_file_size, iter_upload_chunks, stream_to_file
+from downloader import http_downloader
+from encoder import output_encoder
+from shared_index import shared_index
+from long_input import LongInputJob, SAMPLE_RATE, probe_duration
+from decoder import decode_to_wav_file, write_bytes
+from metrics import stage_seconds, ingested_bytes, result_cache_hits
 
 class AudioSeparatorProcessor:
     def __init__(self):
-        self.separator = Separator(
-            output_single_stem="Vocals",
-            model_file_dir=settings.MODEL_DIR,
-            output_dir=settings.OUTPUT_DIR
-        )
+        # 已加载模型的缓存, 仅在分离工作进程中按需创建
+        self._model_cache = None
+        # 最近一次 process_audio 的阶段耗时, 由工作进程带回主进程统计
+        self.last_timings = {}
+
+    @property
+    def model_cache(self) -> ModelCache:
+        if self._model_cache is None:
+            self._model_cache = ModelCache()
+        return self._model_cache
 
-    async def handle_input(self, file, url, request_id):
+    async def handle_input(self, file, url, request_id, model: str = None) -> InputFile:
         """统一处理文件或 URL 逻辑"""
-        if file:
-            return await self.save_upload_file(file, request_id)
+        source = "upload" if file else "download"
+        with stage_seconds.time(stage=source, model=model):
+            if file:
+                input_file = await self.save_upload_file(file, request_id)
+            else:
+                input_file = await self.download_file(url, request_id)
+        ingested_bytes.inc(input_file.size, source=source)
+        with stage_seconds.time(stage="decode", model=model):
+            return await self.materialize(input_file)
+
+    async def materialize(self, input_file: InputFile) -> InputFile:
+        """将仍在内存中的输入解码为 PCM, 以内存盘上的 WAV 交给分离进程
+
+        Separator 只接受文件路径, 因此解码结果写到 INMEMORY_DIR(tmpfs)而不是 TEMP_DIR;
+        解码后超过 INMEMORY_DECODED_MAX_BYTES 或无法从管道解码的输入退回为 TEMP_DIR 中的原始文件。
+        """
+        if input_file.data is None:
+            return input_file
+        wav_path = os.path.join(settings.INMEMORY_DIR, f"{uuid.uuid4().hex}.wav")
+        if await asyncio.to_thread(decode_to_wav_file, input_file.data, wav_path, settings.INMEMORY_DECODED_MAX_BYTES):
+            input_file.path = wav_path
+            input_file.duration = (await asyncio.to_thread(sf.info, wav_path)).duration
         else:
-            return await self.download_file(url, request_id)
+            await asyncio.to_thread(write_bytes, input_file.path, input_file.data)
+        input_file.data = None
+        return input_file
 
-    async def download_file(self, url: str, request_id: str) -> str:
+    async def download_file(self, url: str, request_id: str) -> InputFile:
         """从URL下载文件"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=response.status, detail="Failed to download file")
+        filename = f"{uuid.uuid4().hex}.mp3"
+        file_path = os.path.join(settings.TEMP_DIR, filename)
+        return await http_downloader.download(url, file_path)
 
-                filename = f"{uuid.uuid4().hex}.mp3"
-                file_path = os.path.join(settings.TEMP_DIR, filename)
+    async def save_upload_file(self, file, request_id) -> InputFile:
+        """保存上传文件"""
+        check_file_size(getattr(file, "size", None))
+        file_path = os.path.join(settings.TEMP_DIR, f"{uuid.uuid4().hex}_{file.filename}")
+        return await stream_to_file(iter_upload_chunks(file), file_path,
+                                    memory_limit=settings.INMEMORY_DECODE_MAX_BYTES)
 
-                with open(file_path, 'wb') as f:
-                    f.write(await response.read())
+    async def separate(self, input_file: InputFile, model: str, request_id: str,
+                       output_format: str = None, bitrate: str = None):
+        """分离并按需编码输出; 编码产物以 (模型, 格式, 码率) 单独缓存"""
+        output_format, bitrate = output_encoder.resolve(output_format, bitrate)
+        if output_format == "wav":
+            return await self.separate_wav(input_file, model, request_id)
+        variant = output_encoder.variant(model, output_format, bitrate)
+        cached = await asyncio.to_thread(result_cache.lookup, input_file.sha256, variant)
+        if cached is not None:
+            result_cache_hits.inc(model=model)
+            return cached
+        output_files = await self.separate_wav(input_file, model, request_id)
+        return await self.encode_outputs(input_file, output_files, model, output_format, bitrate)
 
-                return file_path
+    async def encode_outputs(self, input_file: InputFile, output_files, model: str, output_format: str, bitrate: str):
+        """在后台编码线程池中编码 WAV 输出, 并记录到结果缓存"""
+        encoded_files = await output_encoder.encode(output_files, output_format, bitrate, model)
+        variant = output_encoder.variant(model, output_format, bitrate)
+        await asyncio.to_thread(result_cache.store, input_file.sha256, variant, encoded_files)
+        return encoded_files
 
-    async def save_upload_file(self, file, request_id) -> str:
-        """保存上传文件"""
-        file_path = os.path.join(settings.TEMP_DIR, f"{uuid.uuid4().hex}_{file.filename}")
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        return file_path
+    async def separate_wav(self, input_file: InputFile, model: str, request_id: str):
+        """先查结果缓存, 未命中时经微批调度派发到进程池
+
+        多 worker 模式下, 同一输入正由其他请求(本 worker 或其他 worker)分离时等待其结果, 不重复分离。
+        """
+        cached = await asyncio.to_thread(result_cache.lookup, input_file.sha256, model)
+        if cached is not None:
+            result_cache_hits.inc(model=model)
+            return cached
+        key = result_cache.make_key(input_file.sha256, model)
+        # 只有取得登记的请求才能撤销登记; 等待超时后自行分离的请求不持有登记,
+        # 撤销会删掉同一进程内其他请求持有的登记
+        claimed = False
+        if shared_index.enabled:
+            waited = False
+            deadline = time.monotonic() + settings.SHARED_INDEX_INFLIGHT_TIMEOUT
+            while not (claimed := await asyncio.to_thread(shared_index.claim_inflight, key)):
+                if time.monotonic() >= deadline:
+                    # 等待超时(对方卡住或登记已失效)时不再等待, 自行分离
+                    break
+                waited = True
+                await asyncio.sleep(settings.SHARED_INDEX_POLL_SECONDS)
+            # 对方写入结果后才撤销登记, 因此取得登记时结果通常已在缓存中
+            if waited:
+                cached = await asyncio.to_thread(result_cache.lookup, input_file.sha256, model)
+                if cached is not None:
+                    if claimed:
+                        await asyncio.to_thread(shared_index.release_inflight, key)
+                    result_cache_hits.inc(model=model)
+                    return cached
+        try:
+            if await self.is_long_input(input_file):
+                output_files = await self.separate_long(input_file, model, request_id)
+            else:
+                output_files = await micro_batcher.submit(input_file.path, model, request_id)
+            await asyncio.to_thread(result_cache.store, input_file.sha256, model, output_files)
+        finally:
+            if claimed:
+                await asyncio.to_thread(shared_index.release_inflight, key)
+        return output_files
+
+    async def is_long_input(self, input_file: InputFile) -> bool:
+        """时长超过 LONG_INPUT_THRESHOLD_SECONDS 的输入走分窗分离"""
+        if settings.LONG_INPUT_THRESHOLD_SECONDS <= 0:
+            return False
+        duration = input_file.duration
+        if duration is None:
+            duration = await asyncio.to_thread(probe_duration, input_file.path)
+        return duration > settings.LONG_INPUT_THRESHOLD_SECONDS
+
+    async def separate_long(self, input_file: InputFile, model: str, request_id: str):
+        """分窗分离长输入, 结果交叉淡化后顺序写入同一个输出文件"""
+        output_files = None
+        async for event in self.iter_window_segments(input_file, model, request_id):
+            if event["type"] == "done":
+                output_files = event["output_files"]
+        return output_files
+
+    async def separate_stream(self, input_file: InputFile, model: str, request_id: str,
+                              output_format: str = None, bitrate: str = None):
+        """渐进式分离: 每完成一个片段即产出 segment 事件, 最后产出 done 事件
+
+        片段单独写成 vocals_output_{request_id}_partNNNN.wav, 完整结果仍写入 vocals_output_{request_id}.wav,
+        并按 output_format 编码后在 done 事件中返回。
+        """
+        output_format, bitrate = output_encoder.resolve(output_format, bitrate)
+        variant = output_encoder.variant(model, output_format, bitrate)
+        cached = await asyncio.to_thread(result_cache.lookup, input_file.sha256, variant)
+        if cached is not None:
+            result_cache_hits.inc(model=model)
+            yield {"type": "done", "output_files": cached}
+            return
+        output_files = None
+        async for event in self.iter_window_segments(input_file, model, request_id, write_parts=True):
+            if event["type"] == "done":
+                output_files = event["output_files"]
+            else:
+                yield event
+        await asyncio.to_thread(result_cache.store, input_file.sha256, model, output_files)
+        if output_format != "wav":
+            output_files = await self.encode_outputs(input_file, output_files, model, output_format, bitrate)
+        yield {"type": "done", "output_files": output_files}
+
+    async def iter_window_segments(self, input_file: InputFile, model: str, request_id: str,
+                                   write_parts: bool = False):
+        """分窗并行分离, 按时间顺序拼接并写入输出文件, 逐段产出事件"""
+        job = LongInputJob(input_file.path, request_id)
+        output_file = f"vocals_output_{request_id}.wav"
+        output_path = os.path.join(settings.OUTPUT_DIR, output_file)
+        writer = None
+        try:
+            await asyncio.to_thread(job.prepare)
+
+            async def separate_window(window_path, window_request_id):
+                # 每个窗口单独提交到进程池, 不经微批合并, 在途窗口分散到不同工作进程并行分离
+                result, = await separation_executor.separate_batch(model, [(window_path, window_request_id)])
+                if isinstance(result, Exception):
+                    raise result
+                return result
+
+            index = 0
+            start_frame = 0
+            async for segment in job.iter_segments(separate_window):
+                if writer is None:
+                    writer = sf.SoundFile(output_path, "w", samplerate=job.output_samplerate,
+                                          channels=segment.shape[1], subtype=job.output_subtype)
+                await asyncio.to_thread(writer.write, segment)
+                event = {
+                    "type": "segment",
+                    "index": index,
+                    "start": start_frame / job.output_samplerate,
+                    "duration": len(segment) / job.output_samplerate,
+                }
+                if write_parts:
+                    part_file = f"vocals_output_{request_id}_part{index:04d}.wav"
+                    await asyncio.to_thread(sf.write, os.path.join(settings.OUTPUT_DIR, part_file), segment,
+                                            job.output_samplerate, subtype=job.output_subtype)
+                    event["output_file"] = part_file
+                yield event
+                index += 1
+                start_frame += len(segment)
+            if writer is None:
+                raise ValueError("No audio could be decoded from the input")
+        except BaseException:
+            # 失败时不保留不完整的输出文件
+            if writer is not None:
+                writer.close()
+                writer = None
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        finally:
+            if writer is not None:
+                writer.close()
+            await asyncio.to_thread(job.cleanup)
+        yield {"type": "done", "output_files": [output_file]}
+
+    def warm_up(self, model: str):
+        """加载模型并对一小段低音量噪声做一次分离, 预热推理会话(在分离工作进程中执行)"""
+        separator = self.model_cache.get(model)
+        name = f"warmup_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        input_path = os.path.join(settings.TEMP_DIR, f"{name}.wav")
+        # 全零输入会被 Separator 判为无效音频, 因此使用低音量噪声
+        noise = np.random.default_rng(0).standard_normal((int(settings.WARMUP_SECONDS * SAMPLE_RATE), 2)) * 0.01
+        sf.write(input_path, noise.astype(np.float32), SAMPLE_RATE, subtype="FLOAT")
+        try:
+            output_files = separator.separate(input_path, {"Vocals": name})
+        finally:
+            os.remove(input_path)
+        for output_file in output_files:
+            output_path = os.path.join(settings.OUTPUT_DIR, os.path.basename(output_file))
+            if os.path.exists(output_path):
+                os.remove(output_path)
 
     def process_audio(self, input_file: str, model: str, request_id: str):
-        """处理音频"""
-        self.separator.load_model(model_filename=model)
+        """处理音频(在分离工作进程中执行)"""
+        start = time.perf_counter()
+        misses = self.model_cache.misses
+        separator = self.model_cache.get(model)
+        self.last_timings = {
+            "load_model": time.perf_counter() - start,
+            "model_loaded": self.model_cache.misses > misses,
+        }
         # 自定义分离后的人声文件命名格式
         output_names = {
             "Vocals": f"vocals_output_{request_id}",
             # "Instrumental": f"instrumental_output_{random_str}"
         }
-        return self.separator.separate(input_file, output_names)
\ No newline at end of file
+        start = time.perf_counter()
+        output_files = separator.separate(input_file, output_names)
+        self.last_timings["separate"] = time.perf_counter() - start
+        return output_files
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from config import settings
+
+
+class ResultCache:
+    """以 (输入内容哈希, 模型) 为键的分离结果索引, 持久化在 SQLite 中
+
+    命中时直接返回 OUTPUT_DIR 中已有的输出文件; 超出容量时按最近访问时间淘汰,
+    并一并删除对应的输出文件。
+    """
+
+    def __init__(self, db_path: str = None, max_entries: int = None, max_bytes: int = None):
+        self.db_path = db_path or settings.RESULT_CACHE_DB
+        self.max_entries = settings.RESULT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = settings.RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # 多 worker 共用同一索引库, WAL 模式下读写互不阻塞
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    output_files TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(content_hash: str, model: str) -> str:
+        return f"{content_hash}:{model}"
+
+    def lookup(self, content_hash: str, model: str):
+        """返回已缓存的输出文件名列表, 未命中或文件已被删除时返回 None"""
+        key = self.make_key(content_hash, model)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT output_files FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            output_files = json.loads(row[0])
+            if not all(os.path.exists(os.path.join(settings.OUTPUT_DIR, f)) for f in output_files):
+                # 输出文件已被清理, 索引条目随之失效
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return output_files
+
+    def store(self, content_hash: str, model: str, output_files):
+        """记录一次分离结果, 并在超出容量时淘汰最久未访问的条目"""
+        size = 0
+        for f in output_files:
+            try:
+                size += os.path.getsize(os.path.join(settings.OUTPUT_DIR, f))
+            except OSError:
+                pass
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.make_key(content_hash, model), content_hash, model, json.dumps(output_files), size, now, now)
+            )
+            conn.commit()
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        while True:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            if count <= 1 or (count <= self.max_entries and total <= self.max_bytes):
+                return
+            key, output_files = conn.execute(
+                "SELECT key, output_files FROM results ORDER BY last_access LIMIT 1").fetchone()
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            self.evictions += 1
+            for f in json.loads(output_files):
+                path = os.path.join(settings.OUTPUT_DIR, f)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def last_access_by_file(self) -> dict:
+        """输出文件名 -> 最近一次缓存命中时间, 供输出目录清理参考"""
+        with self._lock:
+            rows = self._connect().execute("SELECT output_files, last_access FROM results").fetchall()
+        access = {}
+        for output_files, last_access in rows:
+            for f in json.loads(output_files):
+                access[f] = max(access.get(f, 0), last_access)
+        return access
+
+    def discard_files(self, files):
+        """输出文件被清理后, 删除引用这些文件的索引条目"""
+        files = set(files)
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT key, output_files FROM results").fetchall()
+            stale = [(key,) for key, output_files in rows if files.intersection(json.loads(output_files))]
+            if stale:
+                conn.executemany("DELETE FROM results WHERE key = ?", stale)
+                conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "entries": count,
+            "total_bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+
+import logger
+from config import settings
+from jobs import job_scheduler
+from result_cache import result_cache
+
+
+def _list_files(directory: str):
+    """列出目录下的普通文件, 跳过隐藏文件(如结果缓存索引)"""
+    files = []
+    if not os.path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                files.append((entry.name, entry.stat()))
+            except FileNotFoundError:
+                pass
+    return files
+
+
+def sweep_temp_dirs(ttl: float = None, keep=()) -> int:
+    """删除 TEMP_DIR / INMEMORY_DIR 中超过 ttl 秒未修改的文件(崩溃或异常请求遗留), 返回删除数量
+
+    keep 为仍需保留的文件(排队或执行中任务的输入), 排队时间可能超过 ttl。
+    """
+    ttl = settings.TEMP_TTL_SECONDS if ttl is None else ttl
+    cutoff = time.time() - ttl
+    keep = {os.path.abspath(path) for path in keep}
+    removed = 0
+    for directory in (settings.TEMP_DIR, settings.INMEMORY_DIR):
+        for name, stat in _list_files(directory):
+            path = os.path.abspath(os.path.join(directory, name))
+            if stat.st_mtime < cutoff and path not in keep:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+def sweep_outputs(ttl: float = None, max_bytes: int = None) -> int:
+    """按 TTL 与磁盘预算清理 OUTPUT_DIR, 最久未被访问的文件优先删除, 返回删除数量
+
+    最近访问时间取文件 atime/mtime 与结果缓存命中时间中的最大值;
+    删除的文件会同步从结果缓存索引中移除。
+    """
+    ttl = settings.OUTPUT_TTL_SECONDS if ttl is None else ttl
+    max_bytes = settings.OUTPUT_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    cache_access = result_cache.last_access_by_file()
+    files = []
+    total = 0
+    for name, stat in _list_files(settings.OUTPUT_DIR):
+        last_served = max(stat.st_atime, stat.st_mtime, cache_access.get(name, 0))
+        files.append((last_served, name, stat.st_size))
+        total += stat.st_size
+    files.sort()
+
+    removed = []
+    for last_served, name, size in files:
+        if now - last_served <= ttl and total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(settings.OUTPUT_DIR, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(name)
+    if removed:
+        result_cache.discard_files(removed)
+    return len(removed)
+
+
+class StorageSweeper:
+    """后台定期清理输出目录与临时目录"""
+
+    def __init__(self, interval: float = None):
+        self.interval = settings.SWEEP_INTERVAL_SECONDS if interval is None else interval
+        self._task = None
+
+    async def start(self):
+        # 启动时先清理上次运行遗留的临时文件, 多 worker 时其他 worker 可能已在处理任务
+        await asyncio.to_thread(sweep_temp_dirs, None, job_scheduler.live_input_paths())
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(sweep_temp_dirs, None, job_scheduler.live_input_paths())
+                await asyncio.to_thread(sweep_outputs)
+            except Exception as e:
+                # 清理失败不影响服务, 记录后下个周期重试
+                logger.CustomLogger().error(f"Storage sweep failed - error: {e}")
+
+
+storage_sweeper = StorageSweeper()
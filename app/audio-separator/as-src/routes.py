@@ -1,10 +1,20 @@
 import os
+import json
 import logger
 import uuid
 import time
+import asyncio
+from typing import List
 from fastapi import APIRouter, Form, UploadFile, File, HTTPException
-from models import ApiResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from models import ApiResponse, ModelCacheStats, ResultCacheStats, JobResponse, BatchItemResult, BatchResponse
 from processor import AudioSeparatorProcessor
+from encoder import output_encoder
+from executor import separation_executor
+from jobs import job_scheduler, JobQueueFullError
+from result_cache import result_cache
+from shared_index import shared_index
+from metrics import registry, stage_seconds, requests_in_flight, requests_total
 from config import settings
 from pydantic import ValidationError
 
@@ -16,16 +26,80 @@ processor = AudioSeparatorProcessor()
 new_logger = logger.CustomLogger()
 
 
+def log_completed(request_id: str, response: ApiResponse, kind: str = "Request"):
+    """完成日志: 完整响应体按比例抽样记录, 其余只记录耗时"""
+    if new_logger.should_log_response():
+        new_logger.info(f"{kind} completed - request_id: {request_id}, response: {response}")
+    else:
+        new_logger.info(
+            f"{kind} completed - request_id: {request_id}, processing_time: {response.processing_time:.3f}s")
+
+
+def build_output_urls(output_files):
+    """将分离结果文件名转换为静态服务地址"""
+    return [f"{settings.STATIC_SERVE_URL}/{settings.OUTPUT_DIR}/{file}" for file in output_files]
+
+
+def sse_event(event: str, data: dict) -> str:
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_separation(input_file, model: str, request_id: str, start_time: float,
+                            output_format: str = None, bitrate: str = None):
+    """以 SSE 推送分离进度: 每完成一个人声片段推送 segment, 最后推送 done 或 error"""
+    requests_in_flight.inc()
+    try:
+        async for event in processor.separate_stream(input_file, model, request_id, output_format, bitrate):
+            if event["type"] == "segment":
+                yield sse_event("segment", {
+                    "request_id": request_id,
+                    "index": event["index"],
+                    "start": event["start"],
+                    "duration": event["duration"],
+                    "url": build_output_urls([event["output_file"]])[0],
+                })
+            else:
+                response = ApiResponse(
+                    message="Audio separation completed successfully",
+                    output_files=build_output_urls(event["output_files"]),
+                    request_id=request_id,
+                    processing_time=time.time() - start_time
+                )
+                log_completed(request_id, response)
+                requests_total.inc(model=model, status="success")
+                yield sse_event("done", response.model_dump())
+    except Exception as e:
+        new_logger.error(f"Unexpected error - request_id: {request_id}, error: {e}")
+        requests_total.inc(model=model, status="error")
+        yield sse_event("error", ApiResponse(
+            message=str(e),
+            output_files=[],
+            request_id=request_id,
+            processing_time=time.time() - start_time
+        ).model_dump())
+    finally:
+        requests_in_flight.dec()
+        with stage_seconds.time(stage="cleanup", model=model):
+            if os.path.exists(input_file.path):
+                os.remove(input_file.path)
+
+
 @router.post("/separate-audio/", response_model=ApiResponse)
 async def separate_audio(
         model: str = Form(...),
         file: UploadFile = File(None),
         url: str = Form(None),
+        stream: bool = Form(False),
+        output_format: str = Form(None),
+        bitrate: str = Form(None),
 ):
     # 唯一请求ID
     request_id = uuid.uuid4().hex
     # 记录开始时间
     start_time = time.time()
+    requests_in_flight.inc()
+    input_file = None
 
     try:
         # 记录请求信息
@@ -36,26 +110,35 @@ async def separate_audio(
             raise ValueError("Either file or url must be provided")
         if file and url:
             raise ValueError("Provide either file or url, not both")
+        output_format, bitrate = output_encoder.resolve(output_format, bitrate)
 
         # 处理 url/file 保存到临时目录中
-        temp_file_path = await processor.handle_input(file, url, request_id)
+        input_file = await processor.handle_input(file, url, request_id, model)
+        if stream:
+            # 渐进式返回: 人声片段完成一个推送一个
+            return StreamingResponse(
+                stream_separation(input_file, model, request_id, start_time, output_format, bitrate),
+                media_type="text/event-stream"
+            )
         # 处理音视频文件返回人声音频文件地址
-        output_files = processor.process_audio(temp_file_path, model, request_id)
+        output_files = await processor.separate(input_file, model, request_id, output_format, bitrate)
         new_logger.info(
-            f"remove temp file: {temp_file_path}")
+            f"remove temp file: {input_file.path}")
         # 删除临时文件
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        with stage_seconds.time(stage="cleanup", model=model):
+            if os.path.exists(input_file.path):
+                os.remove(input_file.path)
 
         processing_time = time.time() - start_time
 
         response = ApiResponse(
             message="Audio separation completed successfully",
-            output_files=[f"{settings.STATIC_SERVE_URL}/{settings.OUTPUT_DIR}/{file}" for file in output_files],
+            output_files=build_output_urls(output_files),
             request_id=request_id,
             processing_time=processing_time
         )
-        new_logger.info(f"Request completed - request_id: {request_id}, response: {response}")
+        log_completed(request_id, response)
+        requests_total.inc(model=model, status="success")
         return response
 
     except ValidationError as e:
@@ -70,7 +153,13 @@ async def separate_audio(
     except Exception as e:
         error_message = str(e)
         new_logger.error(f"Unexpected error - request_id: {request_id}, error: {e}")
+    finally:
+        requests_in_flight.dec()
+        # 失败或客户端断开时同样删除临时文件; 流式响应由 stream_separation 负责清理
+        if input_file is not None and not stream and os.path.exists(input_file.path):
+            os.remove(input_file.path)
 
+    requests_total.inc(model=model, status="error")
     processing_time = time.time() - start_time
     return ApiResponse(
         message=error_message,
@@ -78,3 +167,301 @@ async def separate_audio(
         request_id=request_id,
         processing_time=processing_time
     )
+
+
+def remove_input_files(input_files):
+    """删除已落盘但不再处理的输入文件"""
+    for input_file in input_files:
+        if os.path.exists(input_file.path):
+            os.remove(input_file.path)
+
+
+async def separate_batch_item(index: int, source: str, model: str, file=None, url=None, input_file=None,
+                              downloads: asyncio.Semaphore = None, separations: asyncio.Semaphore = None,
+                              output_format: str = None, bitrate: str = None):
+    """批量中的单个条目: 获取输入后立即进入分离, 失败只影响本条目"""
+    request_id = uuid.uuid4().hex
+    start_time = time.time()
+    requests_in_flight.inc()
+    try:
+        if input_file is None:
+            async with downloads:
+                input_file = await processor.handle_input(file, url, request_id, model)
+        async with separations:
+            output_files = await processor.separate(input_file, model, request_id, output_format, bitrate)
+        requests_total.inc(model=model, status="success")
+        return BatchItemResult(
+            index=index,
+            source=source,
+            success=True,
+            message="Audio separation completed successfully",
+            output_files=build_output_urls(output_files),
+            request_id=request_id,
+            processing_time=time.time() - start_time
+        )
+    except Exception as e:
+        new_logger.error(f"Batch item failed - request_id: {request_id}, source: {source}, error: {e}")
+        requests_total.inc(model=model, status="error")
+        return BatchItemResult(
+            index=index,
+            source=source,
+            success=False,
+            message=str(e),
+            output_files=[],
+            request_id=request_id,
+            processing_time=time.time() - start_time
+        )
+    finally:
+        requests_in_flight.dec()
+        if input_file is not None and os.path.exists(input_file.path):
+            os.remove(input_file.path)
+
+
+async def run_batch(model: str, items, batch_id: str, output_format: str = None, bitrate: str = None) -> BatchResponse:
+    """并发下载各条目, 每个条目下载完成即送入分离, 使网络 I/O 与分离计算重叠
+
+    items 为 (source, file, url, input_file) 列表, 已落盘的输入通过 input_file 传入。
+    """
+    start_time = time.time()
+    downloads = asyncio.Semaphore(settings.BATCH_REQUEST_DOWNLOADS)
+    separations = asyncio.Semaphore(settings.BATCH_REQUEST_SEPARATIONS)
+    results = await asyncio.gather(*[
+        separate_batch_item(index, source, model, file, url, input_file, downloads, separations,
+                            output_format, bitrate)
+        for index, (source, file, url, input_file) in enumerate(items)
+    ])
+    failed = sum(1 for result in results if not result.success)
+    response = BatchResponse(
+        message=f"Batch separation completed: {len(results) - failed} succeeded, {failed} failed",
+        results=results,
+        request_id=batch_id,
+        processing_time=time.time() - start_time
+    )
+    log_completed(batch_id, response, kind="Batch")
+    return response
+
+
+def collect_worker_stats():
+    """本 worker 的指标、模型缓存与结果缓存统计, 供多 worker 模式汇总"""
+    return registry.snapshot(), separation_executor.model_cache_stats(), result_cache.stats()
+
+
+async def worker_snapshots():
+    """先上报本 worker 的最新快照, 再读取所有存活 worker 的快照"""
+    await asyncio.to_thread(shared_index.publish, *collect_worker_stats())
+    return await asyncio.to_thread(shared_index.snapshots)
+
+
+def sum_stats(stats: dict, snapshots, section: str, keys) -> dict:
+    """把各 worker 快照中的计数累加到 stats 上"""
+    stats = dict(stats, **{key: 0 for key in keys})
+    for snapshot in snapshots:
+        worker_stats = snapshot[section] or {}
+        for key in keys:
+            stats[key] += worker_stats.get(key, 0)
+    return stats
+
+
+@router.get("/ready")
+async def ready():
+    # 就绪探针: 所有分离进程完成模型预加载与预热后返回 200, 否则 503
+    if separation_executor.ready:
+        return {"ready": True}
+    return JSONResponse(status_code=503, content={"ready": False})
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus 文本格式的各阶段耗时、在途/排队请求数、输入字节数与模型加载次数
+    if shared_index.enabled:
+        # 多 worker 模式下输出所有 worker 的汇总值
+        snapshots = await worker_snapshots()
+        return PlainTextResponse(registry.render([snapshot["metrics"] for snapshot in snapshots]),
+                                 media_type="text/plain; version=0.0.4")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/model-cache/stats", response_model=ModelCacheStats)
+async def model_cache_stats():
+    # 模型缓存命中/未命中/淘汰计数
+    stats = separation_executor.model_cache_stats()
+    if shared_index.enabled:
+        snapshots = await worker_snapshots()
+        stats = sum_stats(stats, snapshots, "model_cache", ("resident_bytes", "hits", "misses", "evictions", "workers"))
+        stats["models"] = sorted({model for snapshot in snapshots
+                                  for model in (snapshot["model_cache"] or {}).get("models", [])})
+    return ModelCacheStats(**stats)
+
+
+@router.get("/result-cache/stats", response_model=ResultCacheStats)
+async def result_cache_stats():
+    # 分离结果缓存条目数、占用空间与命中计数
+    stats = result_cache.stats()
+    if shared_index.enabled:
+        # 条目数与占用空间来自共享的索引库, 命中计数按 worker 累加
+        stats = sum_stats(stats, await worker_snapshots(), "result_cache", ("hits", "misses", "evictions"))
+    return ResultCacheStats(**stats)
+
+
+def job_rejected_response(e: JobQueueFullError) -> JSONResponse:
+    """队列已满时返回 503, 附带队列深度与预计等待时间"""
+    body = JobResponse(
+        status="rejected",
+        message=str(e),
+        queue_depth=e.depth,
+        eta_seconds=e.eta,
+    )
+    headers = {"Retry-After": str(int(e.eta) if e.eta else 30)}
+    return JSONResponse(status_code=503, content=body.model_dump(), headers=headers)
+
+
+@router.post("/separate-audio/jobs", response_model=JobResponse, status_code=202)
+async def submit_separate_job(
+        model: str = Form(...),
+        file: UploadFile = File(None),
+        url: str = Form(None),
+        output_format: str = Form(None),
+        bitrate: str = Form(None),
+):
+    if not file and not url:
+        raise HTTPException(status_code=400, detail="Either file or url must be provided")
+    if file and url:
+        raise HTTPException(status_code=400, detail="Provide either file or url, not both")
+    try:
+        output_format, bitrate = output_encoder.resolve(output_format, bitrate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 先检查队列, 避免在满载时还接收上传内容
+    if job_scheduler.is_full():
+        e = JobQueueFullError(job_scheduler.depth, job_scheduler.eta())
+        new_logger.warning(f"Job rejected - model: {model}, queue_depth: {e.depth}")
+        return job_rejected_response(e)
+
+    # 上传文件需在请求结束前落盘, url 则在任务执行时再下载
+    saved_file = await processor.handle_input(file, None, uuid.uuid4().hex, model) if file else None
+
+    async def work(request_id: str):
+        start_time = time.time()
+        input_file = saved_file
+        try:
+            if input_file is None:
+                input_file = await processor.handle_input(None, url, request_id, model)
+            output_files = await processor.separate(input_file, model, request_id, output_format, bitrate)
+        finally:
+            if input_file and os.path.exists(input_file.path):
+                os.remove(input_file.path)
+        response = ApiResponse(
+            message="Audio separation completed successfully",
+            output_files=build_output_urls(output_files),
+            request_id=request_id,
+            processing_time=time.time() - start_time
+        )
+        log_completed(request_id, response, kind="Job")
+        return response
+
+    try:
+        job = job_scheduler.submit(work, [saved_file.path] if saved_file else [])
+    except JobQueueFullError as e:
+        if saved_file and os.path.exists(saved_file.path):
+            os.remove(saved_file.path)
+        new_logger.warning(f"Job rejected - model: {model}, queue_depth: {e.depth}")
+        return job_rejected_response(e)
+
+    new_logger.info(
+        f"Job submitted - job_id: {job.job_id}, model: {model}, file: {file.filename if file else None}, url: {url}")
+    return JobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        message="Job accepted",
+        queue_depth=job_scheduler.depth,
+        eta_seconds=job_scheduler.eta(job_scheduler.depth - 1),
+    )
+
+
+@router.post("/separate-audio/batch", response_model=BatchResponse)
+async def separate_audio_batch(
+        model: str = Form(...),
+        files: List[UploadFile] = File(None),
+        urls: List[str] = Form(None),
+        job: bool = Form(False),
+        output_format: str = Form(None),
+        bitrate: str = Form(None),
+):
+    files = files or []
+    urls = [url for url in urls or [] if url]
+    if not files and not urls:
+        raise HTTPException(status_code=400, detail="Either files or urls must be provided")
+    if len(files) + len(urls) > settings.BATCH_REQUEST_MAX_ITEMS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {settings.BATCH_REQUEST_MAX_ITEMS} items per batch")
+    try:
+        output_format, bitrate = output_encoder.resolve(output_format, bitrate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    new_logger.info(
+        f"Batch received - model: {model}, files: {[file.filename for file in files]}, urls: {urls}, job: {job}")
+
+    if not job:
+        items = [(file.filename, file, None, None) for file in files] + [(url, None, url, None) for url in urls]
+        return await run_batch(model, items, uuid.uuid4().hex, output_format, bitrate)
+
+    # 以异步任务执行: 上传文件需在请求结束前落盘, url 在任务执行时再下载
+    if job_scheduler.is_full():
+        e = JobQueueFullError(job_scheduler.depth, job_scheduler.eta())
+        new_logger.warning(f"Job rejected - model: {model}, queue_depth: {e.depth}")
+        return job_rejected_response(e)
+    saved_files = []
+    try:
+        for file in files:
+            saved_files.append(await processor.handle_input(file, None, uuid.uuid4().hex, model))
+    except Exception:
+        remove_input_files(saved_files)
+        raise
+    items = [(file.filename, None, None, saved) for file, saved in zip(files, saved_files)] + \
+            [(url, None, url, None) for url in urls]
+
+    async def work(job_id: str):
+        return await run_batch(model, items, job_id, output_format, bitrate)
+
+    try:
+        submitted = job_scheduler.submit(work, [saved.path for saved in saved_files])
+    except JobQueueFullError as e:
+        remove_input_files(saved_files)
+        new_logger.warning(f"Job rejected - model: {model}, queue_depth: {e.depth}")
+        return job_rejected_response(e)
+
+    new_logger.info(f"Batch job submitted - job_id: {submitted.job_id}, model: {model}, items: {len(items)}")
+    return JSONResponse(status_code=202, content=JobResponse(
+        job_id=submitted.job_id,
+        status=submitted.status,
+        message="Job accepted",
+        queue_depth=job_scheduler.depth,
+        eta_seconds=job_scheduler.eta(job_scheduler.depth - 1),
+    ).model_dump())
+
+
+@router.get("/separate-audio/jobs/{job_id}", response_model=JobResponse)
+async def get_separate_job(job_id: str):
+    job = job_scheduler.get(job_id)
+    if job is None and shared_index.enabled:
+        # 任务可能由其他 worker 接收
+        shared_job = await asyncio.to_thread(shared_index.get_job, job_id)
+        if shared_job is not None:
+            return JobResponse(
+                job_id=job_id,
+                status=shared_job["status"],
+                message=shared_job["error"] or "",
+                result=shared_job["result"],
+            )
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        message=job.error or "",
+        queue_depth=job_scheduler.depth,
+        eta_seconds=job_scheduler.eta() if job.status == "queued" else None,
+        result=job.result,
+    )
@@ -0,0 +1,222 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+
+from config import settings
+
+
+def _process_start(pid: int):
+    """进程启动时刻(开机后的时钟节拍数), 读不到 /proc 时返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # comm 字段可能含空格, 从最后一个 ')' 之后开始数; starttime 为第 22 个字段
+    return int(stat[stat.rindex(b")") + 2:].split()[19])
+
+
+def _pid_alive(pid: int, started=None) -> bool:
+    """pid 对应的进程仍是登记时的那个进程
+
+    索引库位于持久卷上, 容器重启后同样的小 pid 会被新进程复用, 因此同时比较进程启动时刻。
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if started is None:
+        return True
+    return _process_start(pid) == started
+
+
+class SharedIndex:
+    """多 worker 模式下各 uvicorn worker 共享的 SQLite 索引
+
+    - workers: worker 槽位(决定绑定的 CPU 组)及其最近一次上报的指标与模型缓存快照
+    - inflight: 正在分离的 (内容哈希, 模型), 其他 worker 遇到相同输入时等待结果而不是重复分离
+    - jobs: 异步任务状态及其输入文件, 任意 worker 都能查询其他 worker 接收的任务, 临时目录清理据此跳过未结束任务的输入
+
+    已完成的分离结果仍由 result_cache 的 SQLite 索引记录, 各 worker 本就共享。
+    单 worker 时不启用。
+    """
+
+    def __init__(self, db_path: str = None, enabled: bool = None):
+        self.db_path = db_path or settings.SHARED_INDEX_DB
+        self.enabled = settings.WORKERS > 1 if enabled is None else enabled
+        self.slot = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._started = _process_start(os.getpid())
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    slot INTEGER PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    pid_started INTEGER,
+                    started_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    metrics TEXT,
+                    model_cache TEXT,
+                    result_cache TEXT
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS inflight (
+                    key TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    pid_started INTEGER,
+                    started_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    pid_started INTEGER,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    inputs TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+        return self._conn
+
+    def claim_slot(self, max_slots: int) -> int:
+        """占用编号最小的空闲槽位(未登记、原进程已退出, 或登记的 pid 就是本进程)"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                taken = {slot: (pid, started) for slot, pid, started in
+                         conn.execute("SELECT slot, pid, pid_started FROM workers")}
+
+                def free(s):
+                    return s not in taken or taken[s][0] == os.getpid() or not _pid_alive(*taken[s])
+
+                slot = next((s for s in range(max_slots) if free(s)), max(taken, default=-1) + 1)
+                now = time.time()
+                conn.execute("INSERT OR REPLACE INTO workers (slot, pid, pid_started, started_at, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (slot, os.getpid(), self._started, now, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self.slot = slot
+        return slot
+
+    def release_slot(self):
+        if self.slot is None:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM workers WHERE slot = ? AND pid = ?", (self.slot, os.getpid()))
+            conn.execute("DELETE FROM inflight WHERE pid = ?", (os.getpid(),))
+        self.slot = None
+
+    def publish(self, metrics: dict, model_cache: dict, result_cache: dict):
+        """上报本 worker 的指标与缓存统计快照"""
+        if self.slot is None:
+            return
+        with self._lock:
+            self._connect().execute(
+                "UPDATE workers SET updated_at = ?, metrics = ?, model_cache = ?, result_cache = ? "
+                "WHERE slot = ? AND pid = ?",
+                (time.time(), json.dumps(metrics), json.dumps(model_cache), json.dumps(result_cache),
+                 self.slot, os.getpid())
+            )
+
+    async def run_publisher(self, collect, interval: float = None):
+        """定期上报本 worker 的快照, collect 返回 (metrics, model_cache, result_cache)"""
+        interval = settings.SHARED_INDEX_PUBLISH_SECONDS if interval is None else interval
+        while True:
+            try:
+                await asyncio.to_thread(self.publish, *collect())
+            except Exception:
+                # 上报失败不影响服务, 下个周期重试
+                pass
+            await asyncio.sleep(interval)
+
+    def snapshots(self):
+        """所有存活 worker 的快照, [{"slot", "pid", "metrics", "model_cache", "result_cache"}, ...]"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT slot, pid, pid_started, metrics, model_cache, result_cache FROM workers ORDER BY slot").fetchall()
+        return [
+            {
+                "slot": slot,
+                "pid": pid,
+                "metrics": json.loads(metrics) if metrics else {},
+                "model_cache": json.loads(model_cache) if model_cache else None,
+                "result_cache": json.loads(result_cache) if result_cache else None,
+            }
+            for slot, pid, started, metrics, model_cache, result_cache in rows if _pid_alive(pid, started)
+        ]
+
+    def claim_inflight(self, key: str) -> bool:
+        """登记本进程开始分离 key, 已被存活进程登记时返回 False"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT pid, pid_started FROM inflight WHERE key = ?", (key,)).fetchone()
+                if row is not None and _pid_alive(*row):
+                    conn.execute("ROLLBACK")
+                    return False
+                conn.execute("INSERT OR REPLACE INTO inflight (key, pid, pid_started, started_at) VALUES (?, ?, ?, ?)",
+                             (key, os.getpid(), self._started, time.time()))
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def release_inflight(self, key: str):
+        with self._lock:
+            self._connect().execute("DELETE FROM inflight WHERE key = ? AND pid = ?", (key, os.getpid()))
+
+    def save_job(self, job_id: str, status: str, result: dict = None, error: str = None, inputs=()):
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO jobs (job_id, pid, pid_started, status, result, error, inputs, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, os.getpid(), self._started, status, json.dumps(result) if result is not None else None,
+                 error, json.dumps(list(inputs)) if inputs else None, time.time())
+            )
+
+    def live_job_inputs(self) -> set:
+        """存活 worker 上排队或执行中任务的输入文件"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT pid, pid_started, inputs FROM jobs "
+                "WHERE status IN ('queued', 'running') AND inputs IS NOT NULL").fetchall()
+        return {path for pid, started, inputs in rows if _pid_alive(pid, started) for path in json.loads(inputs)}
+
+    def get_job(self, job_id: str):
+        """返回 {"status", "result", "error"}, 不存在时返回 None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT status, result, error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, result, error = row
+        return {"status": status, "result": json.loads(result) if result else None, "error": error}
+
+    def prune_jobs(self, ttl: float):
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (time.time() - ttl,))
+
+
+shared_index = SharedIndex()
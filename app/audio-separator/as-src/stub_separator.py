@@ -0,0 +1,36 @@
+import os
+import time
+import subprocess
+import soundfile as sf
+
+from config import settings
+
+
+class StubSeparator:
+    """与 Separator 接口一致的桩实现, 用于压测 HTTP/输入/调度开销
+
+    不加载模型权重: 把输入原样写成 WAV 作为"人声", 并按 SEPARATOR_STUB_SECONDS 模拟每秒音频的推理耗时。
+    """
+
+    def __init__(self, output_dir: str = None, **kwargs):
+        self.output_dir = output_dir or settings.OUTPUT_DIR
+        self.model_instance = None
+
+    def load_model(self, model_filename: str):
+        self.model_filename = model_filename
+
+    def separate(self, audio_file_path: str, custom_output_names: dict = None):
+        name = (custom_output_names or {}).get("Vocals") or os.path.splitext(os.path.basename(audio_file_path))[0]
+        output_file = f"{name}.wav"
+        output_path = os.path.join(self.output_dir, output_file)
+        try:
+            audio, samplerate = sf.read(audio_file_path, dtype="float32")
+            sf.write(output_path, audio, samplerate, subtype="FLOAT")
+            duration = len(audio) / samplerate
+        except RuntimeError:
+            # libsndfile 不支持的容器交给 ffmpeg 转码
+            subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", audio_file_path, "-vn",
+                            "-c:a", "pcm_f32le", output_path], check=True)
+            duration = sf.info(output_path).duration
+        time.sleep(duration * settings.SEPARATOR_STUB_SECONDS)
+        return [output_file]
@@ -3,16 +3,28 @@ from pydantic import BaseModel, HttpUrl
 from audio_separator.separator import Separator
 import traceback
 import logging
+import asyncio
+import shutil
 import aiohttp
 import os
 from typing import Optional, Union
 from pathlib import Path
-import time
+from contextlib import asynccontextmanager
 import numpy as np
-import librosa
+import soundfile as sf
+from math import gcd
+from scipy.signal import resample_poly
 from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 
+# SenseVoice 输入采样率
+STT_SAMPLE_RATE = 16000
+
+# 流水线: 分离/转写两个阶段各自的工作者数(每个工作者持有一份模型), 以及阶段之间的队列长度
+SEPARATION_WORKERS = int(os.getenv("SEPARATION_WORKERS", 1))
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", 1))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))
+
 
 class ApiResponse(BaseModel):
     message: str
@@ -25,27 +37,38 @@ class AudioSeparatorProcessor:
             self,
             model_dir: str = "/tmp/audio-separator-models",
             output_dir: str = "/tmp/audio-separator-outputs",
-            temp_dir: str = "/tmp/audio-separator-temp"
+            temp_dir: str = "/tmp/audio-separator-temp",
+            handoff_dir: str = "/dev/shm/audio-separator-handoff"
     ):
         self.model_dir = model_dir
         self.output_dir = output_dir
         self.temp_dir = temp_dir
+        # 分离结果先写到内存盘, 读入内存转写后再移动到对外目录; 没有 /dev/shm 时直接写 output_dir
+        self.handoff_dir = handoff_dir if os.path.isdir(os.path.dirname(handoff_dir)) else output_dir
+        # 后台移动输出文件的任务, 持有引用避免被回收
+        self._publish_tasks = set()
 
         # 确保必要的目录存在
-        for directory in [model_dir, output_dir, temp_dir]:
+        for directory in [model_dir, output_dir, temp_dir, self.handoff_dir]:
             Path(directory).mkdir(parents=True, exist_ok=True)
 
-        self.separator = Separator(
+        self.separator = self.create_separator()
+
+        # 初始化语音转文字模型
+        self.stt_model = self.create_stt_model()
+
+    def create_separator(self) -> Separator:
+        return Separator(
             log_level=logging.INFO,
             # Vocals 只输出人声
             # Instrumental 只输出器乐
             output_single_stem="Vocals",
-            model_file_dir=model_dir,
-            output_dir=output_dir
+            model_file_dir=self.model_dir,
+            output_dir=self.handoff_dir
         )
 
-        # 初始化语音转文字模型
-        self.stt_model = AutoModel(
+    def create_stt_model(self) -> AutoModel:
+        return AutoModel(
             model="/app/iic/SenseVoiceSmall",
             trust_remote_code=True,
             remote_code="/app/code/model.py",
@@ -89,28 +112,51 @@ class AudioSeparatorProcessor:
             f.write(content)
         return file_path
 
-    def process_audio(self, input_file: str, model: str) -> list[str]:
+    def process_audio(self, input_file: str, model: str, separator: Separator = None) -> list[str]:
         """处理音频文件"""
-        self.separator.load_model(model_filename=model)
-        # 获取当前时间戳
-        current_time = time.time()
+        separator = separator or self.separator
+        separator.load_model(model_filename=model)
 
-        # 生成唯一标识并确保长度为10位
-        random_str = hex(hash(current_time))[2:].zfill(10)[:10]
+        # 生成10位唯一标识, 多个分离工作者并发时不会重名
+        random_str = os.urandom(5).hex()
 
         output_names = {
             "Vocals": f"vocals_output_{random_str}",
             # "Instrumental": f"instrumental_output_{random_str}"
         }
-        return self.separator.separate(input_file, output_names)
-
-    def transcribe_audio(self, audio_path: str, language: str = "zn") -> str:
-        """将音频转换为文本"""
-        # 加载音频文件
-        waveform, sr = librosa.load(audio_path, sr=16000)
-
+        return separator.separate(input_file, output_names)
+
+    def load_vocals(self, output_file: str) -> np.ndarray:
+        """读取分离出的人声 WAV, 下混为单声道并用多相滤波重采样到 16kHz"""
+        audio, sr = sf.read(os.path.join(self.handoff_dir, output_file), dtype="float32", always_2d=True)
+        waveform = audio.mean(axis=1)
+        if sr != STT_SAMPLE_RATE:
+            divisor = gcd(STT_SAMPLE_RATE, sr)
+            waveform = resample_poly(waveform, STT_SAMPLE_RATE // divisor, sr // divisor).astype(np.float32)
+        return waveform
+
+    def publish_output(self, output_file: str):
+        """在后台把人声文件从内存盘移动到对外目录, 不阻塞转写与响应"""
+        if self.handoff_dir == self.output_dir:
+            return
+        task = asyncio.create_task(asyncio.to_thread(
+            shutil.move,
+            os.path.join(self.handoff_dir, output_file),
+            os.path.join(self.output_dir, output_file)
+        ))
+        self._publish_tasks.add(task)
+        task.add_done_callback(self._publish_done)
+
+    def _publish_done(self, task: asyncio.Task):
+        self._publish_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Failed to publish output file: {task.exception()}")
+
+    def transcribe_audio(self, waveform: np.ndarray, language: str = "zn", stt_model: AutoModel = None) -> str:
+        """将 16kHz 单声道音频转换为文本"""
+        stt_model = stt_model or self.stt_model
         # 生成转写结果
-        result = self.stt_model.generate(
+        result = stt_model.generate(
             input=waveform,
             language=language,
             use_itn=True,
@@ -131,9 +177,94 @@ class AudioSeparatorProcessor:
             logging.warning(f"Failed to clean up file {file_path}: {str(e)}")
 
 
-app = FastAPI()
+class PipelineJob:
+    def __init__(self, input_file: str, model: str, language: str):
+        self.input_file = input_file
+        self.model = model
+        self.language = language
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class SeparateTranscribePipeline:
+    """分离 -> 转写两阶段流水线
+
+    两个阶段各有独立的工作者(每个持有自己的 Separator / SenseVoice 模型, 在线程中执行),
+    中间用有界队列衔接: 请求 N 转写时请求 N+1 已在分离, 转写积压时分离阶段随之阻塞。
+    """
+
+    def __init__(self, processor: AudioSeparatorProcessor, separation_workers: int = SEPARATION_WORKERS,
+                 transcription_workers: int = TRANSCRIPTION_WORKERS, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.processor = processor
+        self.separation_workers = separation_workers
+        self.transcription_workers = transcription_workers
+        self.queue_size = queue_size
+        self._separation_queue = None
+        self._transcription_queue = None
+        self._workers = []
+
+    async def start(self):
+        self._separation_queue = asyncio.Queue()
+        self._transcription_queue = asyncio.Queue(maxsize=self.queue_size)
+        # 第一个工作者复用处理器自带的模型, 其余各自创建
+        separators = [self.processor.separator] + [
+            await asyncio.to_thread(self.processor.create_separator) for _ in range(self.separation_workers - 1)]
+        stt_models = [self.processor.stt_model] + [
+            await asyncio.to_thread(self.processor.create_stt_model) for _ in range(self.transcription_workers - 1)]
+        self._workers = [asyncio.create_task(self._separate_loop(separator)) for separator in separators] + \
+                        [asyncio.create_task(self._transcribe_loop(stt_model)) for stt_model in stt_models]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, input_file: str, model: str, language: str):
+        """提交一个请求, 返回 (输出文件列表, 转写文本)"""
+        job = PipelineJob(input_file, model, language)
+        await self._separation_queue.put(job)
+        return await job.future
+
+    async def _separate_loop(self, separator: Separator):
+        while True:
+            job = await self._separation_queue.get()
+            try:
+                output_files = await asyncio.to_thread(
+                    self.processor.process_audio, job.input_file, job.model, separator)
+                waveform = await asyncio.to_thread(self.processor.load_vocals, output_files[0])
+                self.processor.publish_output(output_files[0])
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            await self._transcription_queue.put((job, output_files, waveform))
+
+    async def _transcribe_loop(self, stt_model: AutoModel):
+        while True:
+            job, output_files, waveform = await self._transcription_queue.get()
+            try:
+                transcription = await asyncio.to_thread(
+                    self.processor.transcribe_audio, waveform, job.language, stt_model)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            if not job.future.done():
+                job.future.set_result((output_files, transcription))
+
 
 processor = AudioSeparatorProcessor()
+pipeline = SeparateTranscribePipeline(processor)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pipeline.start()
+    yield
+    await pipeline.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/separate-audio/", response_model=ApiResponse)
@@ -163,12 +294,8 @@ async def separate_audio(
         else:
             temp_file_path = await processor.download_file(str(url))
 
-        # 处理音频
-        output_files = processor.process_audio(temp_file_path, model)
-
-        # step2: 语音文件转文字
-        vocals_path = os.path.join(processor.output_dir, output_files[0])
-        transcription = processor.transcribe_audio(vocals_path, language)
+        # step1: 分离人声; step2: 人声直接在内存中转文字, 两个阶段在流水线中与其他请求重叠执行
+        output_files, transcription = await pipeline.submit(temp_file_path, model, language)
 
         return {
             "message": "Audio separation and transcription completed successfully",
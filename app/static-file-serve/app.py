@@ -1,8 +1,28 @@
 import http.server
-import socketserver
 import os
+import re
+import sys
+import stat
+import time
+import uuid
+import fnmatch
+import datetime
+import email.utils
+import hashlib
+import threading
+import subprocess
+import urllib.parse
+from http import HTTPStatus
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 
+try:
+    # 可选依赖: 有 inotify_simple 时用 inotify 监听输出目录, 否则退回定期扫描
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
 # 加载 .env 文件中的环境变量
 load_dotenv()
 
@@ -10,14 +30,667 @@ load_dotenv()
 HOST = os.getenv('HOST', '0.0.0.0')  # 默认监听所有IP地址
 PORT = int(os.getenv('PORT', '6002'))  # 默认端口号
 DIRECTORY = os.getenv('DIRECTORY', '/opt')  # 默认静态文件目录
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '32'))  # 同时处理的连接数
+MAX_PENDING = int(os.getenv('MAX_PENDING', '256'))  # 等待处理的连接数上限, 超出后暂停 accept
+KEEPALIVE_TIMEOUT = float(os.getenv('KEEPALIVE_TIMEOUT', '15'))  # keep-alive 连接空闲超时(秒)
+MAX_RANGES = int(os.getenv('MAX_RANGES', '16'))  # 单个请求允许的区间数, 超出时返回完整文件
+IMMUTABLE_PATTERN = os.getenv('IMMUTABLE_PATTERN', 'vocals_output_*')  # 内容不会改变的文件名模式
+IMMUTABLE_MAX_AGE = int(os.getenv('IMMUTABLE_MAX_AGE', '31536000'))  # 上述文件的缓存时间(秒)
+CACHE_CONTROL = os.getenv('CACHE_CONTROL', 'no-cache')  # 其他文件的 Cache-Control, 为空则不发送
+METADATA_CACHE_SIZE = int(os.getenv('METADATA_CACHE_SIZE', '4096'))  # 缓存的文件元数据条数
+METADATA_CACHE_TTL = float(os.getenv('METADATA_CACHE_TTL', '5'))  # 文件元数据缓存时间(秒)
+HOT_CACHE_BYTES = int(os.getenv('HOT_CACHE_BYTES', str(256 * 1024 * 1024)))  # 内存中热点文件的总字节预算
+HOT_FILE_MAX_SIZE = int(os.getenv('HOT_FILE_MAX_SIZE', str(32 * 1024 * 1024)))  # 单个文件超过该大小时不进内存
+PREWARM_DIR = os.getenv('PREWARM_DIR', '')  # 监视的输出目录(本服务内的绝对路径), 新文件写完即载入内存, 为空则关闭
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', '1'))  # 无 inotify 时的扫描间隔(秒)
+TRANSCODE_DIR = os.getenv('TRANSCODE_DIR', '/tmp/static-file-serve-transcode')  # 转码结果缓存目录
+TRANSCODE_MAX_BYTES = int(os.getenv('TRANSCODE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))  # 转码缓存总大小, 超出时按 LRU 淘汰
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', '2'))  # 同时进行的 ffmpeg 转码数
+TRANSCODE_TIMEOUT = float(os.getenv('TRANSCODE_TIMEOUT', '300'))  # 请求等待转码完成的最长时间(秒)
+
+RANGE_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+# 输出目录中写完即删的临时文件: 隐藏文件(如结果缓存索引)、编码/转码中的 .part、模型预热输出与长输入的分窗输出
+TRANSIENT_OUTPUT = re.compile(r'^\.|^warmup_|_w\d+\.wav$|\.part$')
+
+
+def parse_range(header, size):
+    """解析 Range 头, 返回 [(起始, 结束)] 闭区间列表
+
+    无 Range 头、格式不合法或区间过多时返回 None(按完整文件响应); 所有区间均无法满足时返回 []。
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    ranges = []
+    specs = header[len("bytes="):].split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    for spec in specs:
+        match = RANGE_SPEC.match(spec)
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first == "":
+            # 后缀区间: 最后 N 个字节
+            length = int(last)
+            if length == 0 or size == 0:
+                # 空文件没有可返回的字节
+                continue
+            ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def make_etag(fs):
+    # 强 ETag: 大小、纳秒级修改时间与 inode 任一变化即视为新内容
+    return f'"{fs.st_size:x}-{fs.st_mtime_ns:x}-{fs.st_ino:x}"'
+
+
+class FileMeta(namedtuple("FileMeta", "size mtime etag last_modified ctype")):
+    @classmethod
+    def from_stat(cls, fs, ctype):
+        return cls(fs.st_size, fs.st_mtime, make_etag(fs), email.utils.formatdate(fs.st_mtime, usegmt=True), ctype)
+
+
+class MetadataCache:
+    """文件路径 -> (stat 结果, MIME 类型) 的 LRU, 条目在 ttl 秒后过期, 避免每个请求都 stat 与猜测类型"""
+
+    def __init__(self, max_entries=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # path -> (过期时间, FileMeta)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[path]
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path, meta):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return meta
+        with self._lock:
+            self._entries[path] = (time.monotonic() + self.ttl, meta)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return meta
+
+    def discard(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+metadata_cache = MetadataCache()
+
+
+class HotFile:
+    """内存中的文件内容, 与打开的文件一样由 send_body 输出"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def close(self):
+        pass
+
+
+class HotFileCache:
+    """字节预算内的文件内容 LRU, 存放刚写出或刚被请求的输出文件, 命中时不再读盘
+
+    条目带有 ETag, 文件被替换后 ETag 不一致即视为失效。
+    """
+
+    def __init__(self, max_bytes=HOT_CACHE_BYTES, max_file_size=HOT_FILE_MAX_SIZE):
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        # path -> (etag, 内容)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, size):
+        return 0 < size <= self.max_file_size
+
+    def get(self, path, etag):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] != etag:
+                self._remove(path)
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path, etag, data):
+        if not self.accepts(len(data)):
+            return
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+            self._entries[path] = (etag, data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def load(self, path):
+        """读入整个文件并放入缓存, 读取期间文件发生变化时放弃"""
+        with open(path, 'rb') as f:
+            fs = os.fstat(f.fileno())
+            if not self.accepts(fs.st_size):
+                return
+            data = f.read()
+        if len(data) == fs.st_size:
+            self.put(path, make_etag(fs), data)
+
+    def discard(self, path):
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+
+    def _remove(self, path):
+        _, data = self._entries.pop(path)
+        self._total_bytes -= len(data)
+
+
+hot_cache = HotFileCache()
+
+
+class OutputPrewarmer(threading.Thread):
+    """监视输出目录, 新文件一写完就载入 hot_cache, 客户端随后的下载直接从内存返回
+
+    有 inotify_simple 时监听 CLOSE_WRITE/MOVED_TO 事件, 否则每 PREWARM_INTERVAL 秒扫描一次,
+    只载入修改时间早于一个扫描间隔(已写完)的新文件。目录不存在或读取出错时记录日志, 一个间隔后重试。
+    """
+
+    def __init__(self, directory=PREWARM_DIR, interval=PREWARM_INTERVAL):
+        super().__init__(daemon=True, name="prewarm")
+        self.directory = os.path.normpath(directory)
+        self.interval = interval
+
+    @staticmethod
+    def wanted(name):
+        return not TRANSIENT_OUTPUT.search(name)
+
+    @staticmethod
+    def log_error(format, *args):
+        # 与请求日志一样写到 stderr
+        sys.stderr.write("[%s] prewarm: %s\n" % (time.strftime("%d/%b/%Y %H:%M:%S"), format % args))
+
+    def load(self, name):
+        try:
+            hot_cache.load(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            # 文件写完后已被删除或改名
+            pass
+        except OSError as e:
+            self.log_error("load %s failed: %s", name, e)
+
+    def run(self):
+        while True:
+            try:
+                if INotify is not None:
+                    self.watch()
+                else:
+                    self.poll()
+            except OSError as e:
+                self.log_error("watching %s failed: %s", self.directory, e)
+            time.sleep(self.interval)
+
+    def watch(self):
+        """监听目录直至其被删除或移走(收到 IGNORED 事件)"""
+        with INotify() as inotify:
+            inotify.add_watch(self.directory, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+            while True:
+                for event in inotify.read():
+                    if event.mask & inotify_flags.IGNORED:
+                        self.log_error("%s is gone, re-watching", self.directory)
+                        return
+                    if event.name and self.wanted(event.name):
+                        self.load(event.name)
+
+    def scan(self):
+        """目录中已写完(修改时间早于一个扫描间隔)的文件, name -> mtime_ns"""
+        now = time.time()
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file() or not self.wanted(entry.name):
+                        continue
+                    fs = entry.stat()
+                except OSError:
+                    continue
+                if now - fs.st_mtime < self.interval:
+                    # 可能仍在写入, 下次扫描再处理
+                    continue
+                files[entry.name] = fs.st_mtime_ns
+        return files
+
+    def poll(self):
+        # name -> 上次看到的 mtime_ns; 首次扫描到的文件不算新文件
+        seen = self.scan()
+        while True:
+            time.sleep(self.interval)
+            current = self.scan()
+            for name, mtime_ns in current.items():
+                if seen.get(name) != mtime_ns:
+                    self.load(name)
+            seen = current
+
+
+# 转码格式 -> (扩展名, ffmpeg 封装格式, 编码参数, 是否有损)
+TRANSCODE_FORMATS = {
+    "wav": ("wav", "wav", ["-c:a", "pcm_s16le"], False),
+    "flac": ("flac", "flac", ["-c:a", "flac"], False),
+    "mp3": ("mp3", "mp3", ["-c:a", "libmp3lame"], True),
+    "opus": ("opus", "ogg", ["-c:a", "libopus"], True),
+}
+TRANSCODE_PARAMS = ("format", "rate", "channels", "bitrate")
+BITRATE_PATTERN = re.compile(r'^\d{2,3}k$')
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class Transcoder:
+    """按查询参数转码音频, 结果以 (源文件 ETag, 参数) 命名缓存在 TRANSCODE_DIR
+
+    转码在后台线程池中进行, 同一变体的并发首次请求共用一次转码; 缓存总大小超过 TRANSCODE_MAX_BYTES 时
+    按最近访问顺序删除最旧的变体。
+    """
+
+    def __init__(self, directory=TRANSCODE_DIR, max_bytes=TRANSCODE_MAX_BYTES, max_workers=TRANSCODE_WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._pool = None
+        # 变体文件名 -> 大小, 按访问先后排序
+        self._entries = None
+        self._total_bytes = 0
+        # 变体文件名 -> 进行中的转码 Future
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_options(query, source):
+        """校验查询参数, 返回 (格式, 采样率, 声道数, 码率); 参数不合法时抛出 ValueError"""
+        def param(name):
+            values = query.get(name)
+            return values[-1].strip().lower() if values else None
+
+        output_format = param("format") or os.path.splitext(source)[1][1:].lower()
+        if output_format not in TRANSCODE_FORMATS:
+            if param("format"):
+                raise ValueError(f"Unsupported format: {output_format}, expected one of {list(TRANSCODE_FORMATS)}")
+            output_format = "wav"
+        rate = param("rate")
+        if rate is not None:
+            if not rate.isdigit() or not 8000 <= int(rate) <= 192000:
+                raise ValueError("rate must be a sample rate between 8000 and 192000")
+            rate = int(rate)
+        channels = param("channels")
+        if channels is not None:
+            if channels not in ("1", "2"):
+                raise ValueError("channels must be 1 or 2")
+            channels = int(channels)
+        bitrate = None
+        if TRANSCODE_FORMATS[output_format][3]:
+            bitrate = param("bitrate") or "128k"
+            if not BITRATE_PATTERN.match(bitrate):
+                raise ValueError("bitrate must look like 128k")
+        return output_format, rate, channels, bitrate
+
+    def variant_name(self, source, etag, options):
+        stem = os.path.splitext(os.path.basename(source))[0]
+        digest = hashlib.sha1(f"{source}|{etag}|{options}".encode()).hexdigest()[:16]
+        return f"{stem}_{digest}.{TRANSCODE_FORMATS[options[0]][0]}"
+
+    def get(self, source, etag, options):
+        """返回变体文件路径, 缓存中没有时转码并等待完成"""
+        name = self.variant_name(source, etag, options)
+        with self._lock:
+            self._load_entries()
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return os.path.join(self.directory, name)
+            future = self._inflight.get(name)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcode")
+                future = self._pool.submit(self._transcode, source, name, options)
+                self._inflight[name] = future
+        return future.result(timeout=TRANSCODE_TIMEOUT)
+
+    def _load_entries(self):
+        # 启动后首次使用时登记磁盘上已有的变体, 按修改时间排序; 清除上次中断留下的临时文件
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+                continue
+            fs = entry.stat()
+            found.append((fs.st_mtime, entry.name, fs.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+        self._total_bytes = sum(self._entries.values())
+
+    def _transcode(self, source, name, options):
+        output_format, rate, channels, bitrate = options
+        _, muxer, codec_args, _ = TRANSCODE_FORMATS[output_format]
+        path = os.path.join(self.directory, name)
+        part_path = f"{path}.part"
+        command = ["ffmpeg", "-y", "-v", "error", "-i", source, "-vn"] + codec_args
+        if rate:
+            command += ["-ar", str(rate)]
+        if channels:
+            command += ["-ac", str(channels)]
+        if bitrate:
+            command += ["-b:a", bitrate]
+        command += ["-f", muxer, part_path]
+        try:
+            try:
+                result = subprocess.run(command, capture_output=True)
+                if result.returncode != 0:
+                    raise TranscodeError(result.stderr.decode(errors="ignore").strip())
+                # 先写临时文件再改名, 其他请求不会读到半成品
+                os.replace(part_path, path)
+            except BaseException:
+                # ffmpeg 缺失、磁盘写满、源文件被删除等任何失败都不留下半成品
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            size = os.path.getsize(path)
+            with self._lock:
+                self._entries[name] = size
+                self._total_bytes += size
+                self._evict(keep=name)
+            return path
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+
+    def _evict(self, keep):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name = next(iter(self._entries))
+            if name == keep:
+                self._entries.move_to_end(name)
+                continue
+            self._total_bytes -= self._entries.pop(name)
+            path = os.path.join(self.directory, name)
+            metadata_cache.discard(path)
+            hot_cache.discard(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+transcoder = Transcoder()
+
 
 class StaticFileServe(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 默认保持连接, 同一客户端的多个请求复用一个连接
+    protocol_version = "HTTP/1.1"
+    # 连接空闲超时后关闭, 释放工作线程
+    timeout = KEEPALIVE_TIMEOUT
+    extensions_map = {**http.server.SimpleHTTPRequestHandler.extensions_map,
+                      '.flac': 'audio/flac', '.opus': 'audio/ogg'}
+
     def translate_path(self, path):
         # 修改默认的路径来返回自定义的静态文件目录
         path = super().translate_path(path)
         return path.replace(self.directory, DIRECTORY)
 
-# 设置服务器
-with socketserver.TCPServer((HOST, PORT), StaticFileServe) as httpd:
-    print(f"Serving on {HOST}:{PORT} from directory {DIRECTORY}")
-    httpd.serve_forever()
\ No newline at end of file
+    def do_GET(self):
+        f = self.send_head()
+        if f:
+            try:
+                self.send_body(f)
+            finally:
+                f.close()
+
+    def send_head(self):
+        """文件请求支持条件请求与 Range(单区间与多区间), 目录请求沿用 SimpleHTTPRequestHandler
+
+        返回打开的文件, 由 send_body 按 self.body_parts 输出; 元数据取自 metadata_cache。
+        带 format/rate/channels/bitrate 查询参数时返回转码后的变体。
+        """
+        # (前缀字节, 偏移, 长度) 列表与结尾字节; None 表示整体拷贝(目录列表等)
+        self.body_parts = None
+        self.body_suffix = b""
+        path = self.translate_path(self.path)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        if any(name in query for name in TRANSCODE_PARAMS):
+            path = self.transcode(path, query)
+            if path is None:
+                return None
+        meta = metadata_cache.get(path)
+        if meta is None:
+            try:
+                fs = os.stat(path)
+            except OSError:
+                fs = None
+            if (fs is not None and stat.S_ISDIR(fs.st_mode)) or path.endswith("/"):
+                return super().send_head()
+            if fs is None or not stat.S_ISREG(fs.st_mode):
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+            meta = metadata_cache.put(path, FileMeta.from_stat(fs, self.guess_type(path)))
+
+        if self.is_not_modified(meta):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_cache_headers(path, meta)
+            self.end_headers()
+            return None
+
+        size = meta.size
+        ranges = parse_range(self.headers.get("Range"), size) if self.if_range_matches(meta) else None
+        if ranges == []:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        f = None
+        if self.command != "HEAD":
+            data = hot_cache.get(path, meta.etag)
+            if data is not None:
+                f = HotFile(data)
+            else:
+                try:
+                    f = open(path, 'rb')
+                except OSError:
+                    # 缓存的元数据已过时(文件被删除)
+                    metadata_cache.discard(path)
+                    self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                    return None
+                if ranges is None:
+                    # 元数据缓存可能已过时(文件在缓存期间被替换), 响应头与热缓存都以打开的文件为准
+                    fs = os.fstat(f.fileno())
+                    if make_etag(fs) != meta.etag:
+                        meta = metadata_cache.put(path, FileMeta.from_stat(fs, meta.ctype))
+                        size = meta.size
+                    if hot_cache.accepts(size):
+                        # 完整请求的小文件整体读入内存, 后续请求直接命中; Range 请求未命中时仍走 sendfile
+                        data = f.read()
+                        f.close()
+                        f = HotFile(data)
+                        if len(data) == size:
+                            hot_cache.put(path, meta.etag, data)
+                        else:
+                            # 读取期间文件仍在被改写: 返回实际读到的内容, 不缓存
+                            metadata_cache.discard(path)
+                            size = len(data)
+        try:
+            if ranges is None:
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-type", meta.ctype)
+                self.send_header("Content-Length", str(size))
+                self.body_parts = [(b"", 0, size)]
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-type", meta.ctype)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.body_parts = [(b"", start, end - start + 1)]
+            else:
+                boundary = uuid.uuid4().hex
+                self.body_parts = [
+                    (f"\r\n--{boundary}\r\nContent-Type: {meta.ctype}\r\n"
+                     f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n".encode("latin-1"), start, end - start + 1)
+                    for start, end in ranges
+                ]
+                self.body_suffix = f"\r\n--{boundary}--\r\n".encode("latin-1")
+                length = sum(len(prefix) + count for prefix, _, count in self.body_parts) + len(self.body_suffix)
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-type", f"multipart/byteranges; boundary={boundary}")
+                self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_cache_headers(path, meta)
+            self.end_headers()
+            return f
+        except:
+            if f is not None:
+                f.close()
+            raise
+
+    def transcode(self, path, query):
+        """返回源文件按查询参数转码后的变体路径, 出错时发送错误响应并返回 None"""
+        try:
+            fs = os.stat(path)
+        except OSError:
+            fs = None
+        if fs is None or not stat.S_ISREG(fs.st_mode):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        if not self.guess_type(path).startswith(("audio/", "video/")):
+            self.send_error(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Only audio files can be transcoded")
+            return None
+        try:
+            options = transcoder.parse_options(query, path)
+        except ValueError as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return None
+        try:
+            return transcoder.get(path, make_etag(fs), options)
+        except FutureTimeoutError:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "Transcoding is still in progress")
+        except TranscodeError as e:
+            self.log_error("transcode %s failed: %s", path, e)
+            self.send_error(HTTPStatus.UNPROCESSABLE_ENTITY, "Transcoding failed")
+        except Exception as e:
+            self.log_error("transcode %s failed: %r", path, e)
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "Transcoding failed")
+        return None
+
+    def send_cache_headers(self, path, meta):
+        self.send_header("ETag", meta.etag)
+        self.send_header("Last-Modified", meta.last_modified)
+        if fnmatch.fnmatchcase(os.path.basename(path), IMMUTABLE_PATTERN):
+            # 分离结果文件名唯一且写完后不再改变, 可长期缓存
+            self.send_header("Cache-Control", f"public, max-age={IMMUTABLE_MAX_AGE}, immutable")
+        elif CACHE_CONTROL:
+            self.send_header("Cache-Control", CACHE_CONTROL)
+
+    def is_not_modified(self, meta):
+        """If-None-Match 命中 ETag, 或(无 If-None-Match 时)If-Modified-Since 不早于修改时间时返回 True"""
+        if "If-None-Match" in self.headers:
+            tags = [tag.strip() for tag in self.headers["If-None-Match"].split(",")]
+            # GET/HEAD 的 If-None-Match 使用弱比较, 忽略 W/ 前缀
+            return any(tag == "*" or tag.replace("W/", "", 1) == meta.etag for tag in tags)
+        if "If-Modified-Since" not in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        return int(meta.mtime) <= ims.timestamp()
+
+    def if_range_matches(self, meta):
+        """没有 If-Range, 或其 ETag(强比较)/日期与当前文件一致时才按 Range 响应"""
+        value = self.headers.get("If-Range")
+        if not value:
+            return True
+        value = value.strip()
+        if value.startswith('"') or value.startswith("W/"):
+            return value == meta.etag
+        return value == meta.last_modified
+
+    def send_body(self, f):
+        """内存中的文件直接写出; 磁盘文件经 socket.sendfile(底层为 os.sendfile)由内核发送, 不经过用户态缓冲"""
+        if self.body_parts is None:
+            self.copyfile(f, self.wfile)
+            return
+        data = memoryview(f.data) if isinstance(f, HotFile) else None
+        for prefix, offset, count in self.body_parts:
+            if prefix:
+                self.wfile.write(prefix)
+            if count <= 0:
+                continue
+            if data is not None:
+                self.wfile.write(data[offset:offset + count])
+            else:
+                self.connection.sendfile(f, offset, count)
+        if self.body_suffix:
+            self.wfile.write(self.body_suffix)
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """用固定大小的线程池并发处理连接, 单个慢客户端不再阻塞其他下载"""
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=MAX_WORKERS, max_pending=MAX_PENDING):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="static-file-serve")
+        # 处理中与排队中的连接总数上限, 达到上限时 accept 循环阻塞, 新连接留在内核 backlog 中
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    if PREWARM_DIR:
+        OutputPrewarmer().start()
+    # 设置服务器
+    with PooledHTTPServer((HOST, PORT), StaticFileServe) as httpd:
+        print(f"Serving on {HOST}:{PORT} from directory {DIRECTORY} with {MAX_WORKERS} workers")
+        httpd.serve_forever()